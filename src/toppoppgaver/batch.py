@@ -0,0 +1,201 @@
+# %%
+import json
+import logging
+import argparse
+from pathlib import Path
+from functools import partial
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from nedlasting import lag_sesjon, samtidig
+from inkrementell import Sladdelager
+from profilering import Stegmaler
+from get_survey_data import merge_surveys
+from etterbehandling import les_skjema
+from main import (
+    forbered_navn,
+    last_ned,
+    lag_cache,
+    vask_survey,
+    eksporter,
+    logg_statistikk,
+    inkrementell,
+    profiler_steg,
+    kolonneskjema,
+)
+
+# %%
+batch_mappe = Path("../../data/batch/")
+
+
+# %%
+def les_konfig(filsti: Path):
+    """Les listen med undersøkelser fra en JSON-fil
+
+    Hver undersøkelse er en dictionary med survey_id og eventuelt navn
+    (filnavnet for resultatet), kolonneskjema (sti til et eget kolonneskjema,
+    se etterbehandling.les_skjema) og skjulte_kolonner (kolonneområder som
+    skjules i regnearket, overstyrer skjemaet). En ren liste med survey_id-er
+    er også lov.
+    """
+    with open(filsti, "r", encoding="utf-8") as f:
+        surveys = json.load(f)
+    return [s if isinstance(s, dict) else {"survey_id": str(s)} for s in surveys]
+
+
+# %%
+def skjema_for(konfig: dict):
+    """
+    Kolonneskjemaet for én undersøkelse, med eventuelle skjulte kolonner fra konfigurasjonen
+    """
+    skjema = (
+        les_skjema(konfig["kolonneskjema"])
+        if "kolonneskjema" in konfig
+        else kolonneskjema
+    )
+    if "skjulte_kolonner" in konfig:
+        skjema = {**skjema, "skjulte_kolonner": konfig["skjulte_kolonner"]}
+    return skjema
+
+
+# %%
+def kjør_batch(surveys: list, mappe: Path = batch_mappe, slå_sammen=False):
+    """Vasker flere undersøkelser i én kjøring med samme varme pipeline
+
+    Navnelisten, navnematcheren, spacy-modellen og cachen lastes én gang.
+    Eksporten for neste undersøkelse lastes ned mens den forrige vaskes.
+
+    parameters:
+    -----------
+    surveys: list
+        Undersøkelsene som skal vaskes, se les_konfig
+    mappe: Path
+        Mappen der nedlastede eksporter og resultater skrives
+    slå_sammen: bool
+        True om undersøkelser med de samme spørsmålene også skal skrives
+        sammenslått til én fil per spørsmålssett
+    """
+    mappe = Path(mappe)
+    maler = Stegmaler(profiler_steg=profiler_steg, mappe=mappe)
+    sesjon = lag_sesjon()
+
+    def hent(konfig: dict):
+        return last_ned(
+            sesjon, konfig["survey_id"], mappe / f"{konfig['survey_id']}.csv"
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as nedlaster:
+        with maler.steg("nedlasting") as s:
+            # navnelisten og første undersøkelse lastes ned samtidig
+            hentet = samtidig(
+                {
+                    "navn": partial(forbered_navn, sesjon),
+                    "svar": partial(hent, surveys[0]),
+                }
+            )
+            navn = hentet["navn"]
+            s["antall"] = len(navn)
+        fingeravtrykk, cache = lag_cache(navn)
+        neste = None
+        resultater = {}
+        for i, konfig in enumerate(surveys):
+            survey_id = konfig["survey_id"]
+            survey_fil = hentet["svar"] if i == 0 else neste.result()
+            if i + 1 < len(surveys):
+                neste = nedlaster.submit(hent, surveys[i + 1])
+
+            logging.info(f"Vasker undersøkelse {survey_id} 🧹")
+            lager = (
+                Sladdelager(mappe / f"vasket-{survey_id}.sqlite")
+                if inkrementell
+                else None
+            )
+            biter = [] if slå_sammen else None
+            telling, per_entitet, etiketter = vask_survey(
+                survey_fil,
+                navn,
+                cache,
+                maler,
+                filstamme=mappe / konfig.get("navn", survey_id),
+                lager=lager,
+                fingeravtrykk=fingeravtrykk,
+                samle=biter,
+                skjema=skjema_for(konfig),
+            )
+            if lager is not None:
+                lager.close()
+            logg_statistikk(telling, per_entitet, maler)
+            resultater[survey_id] = {
+                "telling": telling,
+                "per_entitet": per_entitet,
+                "etiketter": etiketter,
+                "biter": biter,
+                "konfig": konfig,
+            }
+    cache.close()
+
+    if slå_sammen:
+        slå_sammen_like(resultater, mappe, maler)
+
+    totalt = Counter()
+    for r in resultater.values():
+        totalt.update(r["per_entitet"])
+    logging.info(f"Sladdede entiteter i alle undersøkelsene: {dict(totalt)}")
+    rapport = maler.skriv_rapport()
+    logging.info(f"Rapport med tid og minne per steg er lagret i {rapport}")
+    return resultater
+
+
+# %%
+def slå_sammen_like(resultater: dict, mappe: Path, maler: Stegmaler):
+    """
+    Skriv undersøkelser med de samme spørsmålene sammenslått til én fil per spørsmålssett
+    """
+    grupper = {}
+    for survey_id, r in resultater.items():
+        grupper.setdefault(tuple(r["etiketter"]), []).append(survey_id)
+    for survey_ids in grupper.values():
+        if len(survey_ids) < 2:
+            continue
+        logging.info(f"Slår sammen undersøkelsene {', '.join(survey_ids)}")
+        første = resultater[survey_ids[0]]
+        samlet = merge_surveys(
+            [bit for survey_id in survey_ids for bit in resultater[survey_id]["biter"]],
+            [
+                survey_id
+                for survey_id in survey_ids
+                for _ in resultater[survey_id]["biter"]
+            ],
+        )
+        eksporter(
+            [samlet],
+            mappe / f"samlet-{'-'.join(survey_ids)}",
+            {**første["etiketter"], "survey": "survey"},
+            maler,
+            hide_columns=skjema_for(første["konfig"])["skjulte_kolonner"],
+        )
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Vask flere undersøkelser fra Task Analytics i samme kjøring"
+    )
+    parser.add_argument("survey_id", nargs="*", help="id-ene til undersøkelsene")
+    parser.add_argument(
+        "--konfig", type=Path, help="JSON-fil med undersøkelsene, se les_konfig"
+    )
+    parser.add_argument("--ut", type=Path, default=batch_mappe)
+    parser.add_argument(
+        "--slaa-sammen",
+        action="store_true",
+        help="skriv også undersøkelser med de samme spørsmålene til én fil",
+    )
+    args = parser.parse_args()
+
+    surveys = les_konfig(args.konfig) if args.konfig else []
+    surveys += [{"survey_id": s} for s in args.survey_id]
+    if not surveys:
+        parser.error("oppgi minst én undersøkelse")
+    kjør_batch(surveys, mappe=args.ut, slå_sammen=args.slaa_sammen)
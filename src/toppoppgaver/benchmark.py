@@ -0,0 +1,175 @@
+# %%
+import json
+import logging
+import argparse
+import tracemalloc
+from pathlib import Path
+from functools import partial
+
+import pandas as pd
+
+import ner_vask_opplysninger as ner
+from navnematcher import hent_navnematcher
+from pretty_sheets import make_workbook
+from profilering import Stegmaler
+from get_survey_data import return_open_answers
+from syntetisk_survey import lag_survey, skriv_survey, fornavn, etternavn
+
+# %%
+benchmark_mappe = Path("../../data/benchmark/")
+
+
+# %%
+def _mål(maler: Stegmaler, navn: str, antall: int, funksjon, python_minne=False):
+    """
+    Kjør funksjonen som et steg, eventuelt med høyeste Python-minne fra tracemalloc
+
+    tracemalloc gjør koden vesentlig tregere, så gjennomstrømningen bør måles uten
+    """
+    if python_minne:
+        tracemalloc.start()
+    try:
+        with maler.steg(navn, antall=antall) as s:
+            resultat = funksjon()
+        if python_minne:
+            s["maks_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024**2, 1)
+    finally:
+        if python_minne:
+            tracemalloc.stop()
+    return resultat
+
+
+# %%
+def kjør_benchmark(
+    størrelser: list,
+    modell=None,
+    andel_besvart=0.1,
+    andel_pii=0.1,
+    mappe: Path = benchmark_mappe,
+    seed=0,
+    python_minne=False,
+):
+    """Mål gjennomstrømning og minne for vaskestegene på syntetiske svar
+
+    Stegene er regex_vask_df, flashtext_sladd, sladd_tekster og make_workbook.
+    sladd_tekster hoppes over dersom modell ikke er angitt.
+
+    parameters:
+    -----------
+    størrelser: list
+        Antall rader i hver syntetiske eksport
+    modell: str
+        Spacy-modellen som brukes i sladd_tekster, f.eks. nb_core_news_lg
+    andel_besvart: float
+        Sannsynligheten for at en fritekstcelle er besvart
+    andel_pii: float
+        Sannsynligheten for at et fritekstsvar inneholder en personopplysning
+    mappe: Path
+        Mappen der syntetiske eksporter og regneark skrives
+    seed: int
+        Seed for de syntetiske dataene
+    python_minne: bool
+        True om høyeste Python-minne per steg skal måles med tracemalloc
+    """
+    mappe = Path(mappe)
+    navn = sorted({n.lower() for n in fornavn + etternavn})
+    # bygg navnetrien før målingene slik at den ikke telles med i første steg
+    hent_navnematcher(navn, mappe=None)
+    mål = partial(_mål, python_minne=python_minne)
+    resultater = []
+    for størrelse in størrelser:
+        logging.info(f"Benchmark med {størrelse} rader")
+        maler = Stegmaler(logg=False, mappe=mappe)
+        df, _ = lag_survey(
+            størrelse, andel_besvart=andel_besvart, andel_pii=andel_pii, seed=seed
+        )
+        filsti = skriv_survey(df, mappe / f"survey-{størrelse}.csv")
+        df = mål(maler, "les csv", størrelse, lambda: pd.read_csv(filsti).iloc[1:])
+        kolonner = return_open_answers(df)
+        # én kolonne med alle fritekstsvarene, slik at stegene måles per tekst
+        tekster = pd.DataFrame(
+            {
+                "tekst": df[kolonner]
+                .stack(future_stack=True)
+                .dropna()
+                .reset_index(drop=True)
+            }
+        )
+        antall = len(tekster)
+
+        for entity in ["FNR", "TLF", "EPOST"]:
+            mål(
+                maler,
+                f"regex_vask_df {entity}",
+                antall,
+                partial(ner.regex_vask_df, tekster.copy(), entity, "tekst"),
+            )
+        mål(
+            maler,
+            "flashtext_sladd",
+            antall,
+            partial(ner.flashtext_sladd, tekster.copy(), "tekst", navn),
+        )
+        if modell:
+            mål(
+                maler,
+                "sladd_tekster",
+                antall,
+                partial(
+                    ner.sladd_tekster,
+                    tekster.copy(),
+                    "tekst",
+                    navn,
+                    print_progress=False,
+                    modell=modell,
+                ),
+            )
+        mål(
+            maler,
+            "make_workbook",
+            størrelse,
+            partial(make_workbook, df, mappe / f"survey-{størrelse}.xlsx"),
+        )
+        rapport = maler.rapport()
+        rapport.update({"rader": størrelse, "tekster": antall})
+        resultater.append(rapport)
+        for steg in rapport["steg"]:
+            logging.info(
+                f"  {steg['steg']}: {steg.get('per_sek', 0):.0f} per sek, "
+                f"maks RSS {steg['maks_rss_mb']:.0f} MB"
+            )
+    return resultater
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Mål gjennomstrømning og minne for vaskingen på syntetiske svar"
+    )
+    parser.add_argument("--storrelser", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument(
+        "--modell", help="spacy-modell for sladd_tekster, f.eks. nb_core_news_lg"
+    )
+    parser.add_argument("--andel-besvart", type=float, default=0.1)
+    parser.add_argument("--andel-pii", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--python-minne",
+        action="store_true",
+        help="mål høyeste Python-minne per steg med tracemalloc (tregere)",
+    )
+    parser.add_argument("--ut", type=Path, default=benchmark_mappe / "benchmark.json")
+    args = parser.parse_args()
+
+    resultater = kjør_benchmark(
+        args.storrelser,
+        modell=args.modell,
+        andel_besvart=args.andel_besvart,
+        andel_pii=args.andel_pii,
+        seed=args.seed,
+        python_minne=args.python_minne,
+    )
+    args.ut.parent.mkdir(parents=True, exist_ok=True)
+    args.ut.write_text(json.dumps(resultater, ensure_ascii=False, indent=2))
+    logging.info(f"Resultatene er lagret i {args.ut}")
@@ -0,0 +1,105 @@
+# %%
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# %%
+skjema_fil = Path("../patterns/kolonneskjema.json")
+
+# unike IDer og lange tall i URLer, byttes ut i rekkefølge
+url_mønstre = [r"[0-9a-z.-]{36}", r"\d{5,}"]
+url_erstatning = "ANONYMISERT"
+
+# handlingene en kolonne kan ha i skjemaet
+handlinger = {"url", "tid", "fjern", "behold"}
+
+
+# %%
+def les_skjema(filsti: Path = skjema_fil):
+    """Les kolonneskjemaet for etterbehandlingen
+
+    Skjemaet er en JSON-fil med "kolonner", der hver kolonne har en
+    handling, og "skjulte_kolonner" med kolonneområdene som skjules i
+    regnearket. Handlingene er:
+
+    * url: bytt ut unike IDer og lange tall i URLer
+    * tid: les tidspunkt med "format" (standard ISO8601) og rund av til "runde" (standard h)
+    * fjern: ta kolonnen ut av resultatet
+    * behold: la kolonnen være som den er
+
+    Kaster ValueError dersom en kolonne har en ukjent handling.
+    """
+    with open(filsti, "r", encoding="utf-8") as f:
+        skjema = json.load(f)
+    skjema.setdefault("kolonner", {})
+    skjema.setdefault("skjulte_kolonner", [])
+    for kolonne, regel in skjema["kolonner"].items():
+        if regel.get("handling") not in handlinger:
+            raise ValueError(
+                f"Ukjent handling {regel.get('handling')} for kolonnen {kolonne} i {filsti}"
+            )
+    return skjema
+
+
+# %%
+def kolonner_med(skjema: dict, handling: str, kolonner=None):
+    """
+    Kolonnene i skjemaet med handlingen, eventuelt bare de som finnes i kolonner
+    """
+    return [
+        k
+        for k, regel in skjema["kolonner"].items()
+        if regel["handling"] == handling and (kolonner is None or k in kolonner)
+    ]
+
+
+# %%
+def vask_urler(df: pd.DataFrame, urler: list):
+    """
+    Bytt ut unike IDer og lange tall i URL-kolonnene med ett kall til replace
+    """
+    if urler:
+        df[urler] = df[urler].replace(url_mønstre, url_erstatning, regex=True)
+    return df
+
+
+# %%
+def runde_timer(df: pd.DataFrame, tid: list, format="ISO8601", runde="h"):
+    """
+    Les tidspunktene med fast format og rund av til nærmeste time
+    """
+    for i in tid:
+        df[i] = pd.to_datetime(df[i], format=format).dt.round(runde)
+    return df
+
+
+# %%
+def etterbehandle(df: pd.DataFrame, skjema: dict):
+    """Kjør handlingene i kolonneskjemaet på de vaskede svarene
+
+    Kolonner i skjemaet som ikke finnes i svarene hoppes over. Alle
+    URL-kolonnene vaskes samlet, og tidskolonner med samme format og
+    avrunding leses samlet.
+
+    parameters:
+    -----------
+    df: pd.DataFrame
+        De vaskede svarene, endres på stedet
+    skjema: dict
+        Kolonneskjemaet, se les_skjema
+    """
+    vask_urler(df, kolonner_med(skjema, "url", df.columns))
+
+    tidsgrupper = {}
+    for kolonne in kolonner_med(skjema, "tid", df.columns):
+        regel = skjema["kolonner"][kolonne]
+        nøkkel = (regel.get("format", "ISO8601"), regel.get("runde", "h"))
+        tidsgrupper.setdefault(nøkkel, []).append(kolonne)
+    for (format, runde), tid in tidsgrupper.items():
+        runde_timer(df, tid, format=format, runde=runde)
+
+    fjernes = kolonner_med(skjema, "fjern", df.columns)
+    if fjernes:
+        df = df.drop(columns=fjernes)
+    return df
@@ -0,0 +1,210 @@
+# %%
+import re
+import json
+import random
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import ner_vask_opplysninger as ner
+from navnematcher import hent_navnematcher
+from profilering import Stegmaler
+from get_survey_data import return_open_answers
+from syntetisk_survey import lag_survey, fornavn, etternavn
+
+# %%
+evaluering_mappe = Path("../../data/benchmark/")
+standard_nivåer = ["regex", "sm", "md", "lg"]
+# entitetene det måles recall for
+evaluerte_ents = ["PER", "FNR", "TLF", "EPOST"]
+
+
+# %%
+def lag_utvalg(antall_rader=2000, andel_pii=0.3, seed=0):
+    """Lag et merket utvalg med fritekstsvar fra syntetisk_survey
+
+    Returnerer tekstene og fasiten som en liste med (entitet, verdi) per tekst
+    """
+    df, fasit = lag_survey(
+        antall_rader, andel_besvart=0.2, andel_pii=andel_pii, seed=seed
+    )
+    svar = df.iloc[1:].reset_index(drop=True)
+    fasit_per_celle = {}
+    for rad, kolonne, entitet, verdi in fasit.itertuples(index=False):
+        fasit_per_celle.setdefault((rad, kolonne), []).append((entitet, verdi))
+    tekster = []
+    fasiter = []
+    for kolonne in return_open_answers(svar):
+        for rad, tekst in svar[kolonne].dropna().items():
+            tekster.append(tekst)
+            fasiter.append(fasit_per_celle.get((rad, kolonne), []))
+    return tekster, fasiter
+
+
+# %%
+def er_sladdet(verdi: str, vasket: str):
+    """
+    True om ingen del av verdien finnes igjen som eget ord i den vaskede teksten
+
+    Sammenligner med store og små bokstaver, slik at navnet Per ikke forveksles
+    med taggen PER
+    """
+    return not any(
+        re.search(rf"(?<!\w){re.escape(del_)}(?!\w)", vasket) for del_ in verdi.split()
+    )
+
+
+# %%
+def recall(fasiter: list, vasket: list):
+    """
+    Andelen av personopplysningene i fasiten som er sladdet, per entitet
+    """
+    funnet = {e: 0 for e in evaluerte_ents}
+    totalt = {e: 0 for e in evaluerte_ents}
+    for fasit, tekst in zip(fasiter, vasket):
+        for entitet, verdi in fasit:
+            totalt[entitet] += 1
+            funnet[entitet] += er_sladdet(verdi, tekst)
+    return {e: round(funnet[e] / totalt[e], 4) if totalt[e] else None for e in totalt}
+
+
+# %%
+def evaluer_nivå(nivå: str, tekster: list, fasiter: list, navn: list):
+    """Vask utvalget med ett modellnivå og mål recall, tekster per sekund og minne
+
+    Kjøres i en egen prosess per nivå, slik at minnebruken ikke blandes
+    med de andre nivåene.
+    """
+    maler = Stegmaler(logg=False)
+    # navnetrien bygges før målingen, slik den er lastet i en vanlig kjøring
+    hent_navnematcher(navn)
+    try:
+        if ner.modell_for(nivå) is not None:
+            with maler.steg("last modell"):
+                ner.hent_nlp(nivå)
+        with maler.steg("vask", antall=len(tekster)):
+            vasket = ner.sladd_liste(
+                tekster,
+                term_liste=navn,
+                ents_list=evaluerte_ents,
+                print_progress=False,
+                modell=nivå,
+            )
+    except OSError as e:
+        return {"nivå": nivå, "modell": ner.modell_for(nivå), "feil": str(e)}
+    steg = {s["steg"]: s for s in maler.steg_liste}
+    return {
+        "nivå": nivå,
+        "modell": ner.modell_for(nivå),
+        "recall": recall(fasiter, vasket),
+        "tekster_per_sek": steg["vask"].get("per_sek"),
+        "lastetid_sek": steg.get("last modell", {}).get("veggtid_sek", 0),
+        "maks_rss_mb": maler.rapport()["maks_rss_mb"],
+    }
+
+
+# %%
+def kjør_evaluering(
+    nivåer=standard_nivåer,
+    antall_rader=2000,
+    andel_pii=0.3,
+    andel_ukjente_navn=0.2,
+    seed=0,
+):
+    """Sammenlign modellnivåene på et merket utvalg
+
+    Hvert nivå kjøres i en ny prosess. Navnelisten som brukes i vaskingen
+    mangler andel_ukjente_navn av navnene i utvalget, slik at det måles hvor
+    mye NER finner av navn som ikke står i SSB-listene.
+
+    parameters:
+    -----------
+    nivåer: list
+        Modellnivåene (sm, md, lg, regex) eller navn på spacy-modeller
+    antall_rader: int
+        Antall svar i det syntetiske utvalget
+    andel_pii: float
+        Sannsynligheten for at et fritekstsvar inneholder en personopplysning
+    andel_ukjente_navn: float
+        Andelen av navnene i utvalget som ikke står i navnelisten
+    seed: int
+        Seed for utvalget og navnene som utelates
+    """
+    tekster, fasiter = lag_utvalg(antall_rader, andel_pii, seed)
+    alle_navn = sorted({n.lower() for n in fornavn + etternavn})
+    rng = random.Random(seed)
+    ukjente = set(rng.sample(alle_navn, round(len(alle_navn) * andel_ukjente_navn)))
+    navn = [n for n in alle_navn if n not in ukjente]
+    logging.info(
+        f"{len(tekster)} tekster, {sum(map(len, fasiter))} personopplysninger, "
+        f"{len(ukjente)} navn mangler i navnelisten"
+    )
+
+    resultater = []
+    for nivå in nivåer:
+        logging.info(f"Evaluerer {nivå}")
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            resultat = executor.submit(
+                evaluer_nivå, nivå, tekster, fasiter, navn
+            ).result()
+        if "feil" in resultat:
+            logging.warning(f"{nivå} kunne ikke evalueres: {resultat['feil']}")
+        resultater.append(resultat)
+    return resultater
+
+
+# %%
+def tabell(resultater: list):
+    """
+    Resultatene som en tabell med ett nivå per rad
+    """
+    return pd.DataFrame(
+        [
+            {
+                "nivå": r["nivå"],
+                **{e: (r.get("recall") or {}).get(e) for e in evaluerte_ents},
+                "tekster/sek": r.get("tekster_per_sek"),
+                "lastetid (s)": r.get("lastetid_sek"),
+                "maks RSS (MB)": r.get("maks_rss_mb"),
+            }
+            for r in resultater
+        ]
+    ).set_index("nivå")
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Sammenlign recall, gjennomstrømning og minne for modellnivåene"
+    )
+    parser.add_argument(
+        "nivaaer",
+        nargs="*",
+        default=standard_nivåer,
+        help="modellnivåer (sm, md, lg, regex) eller spacy-modeller",
+    )
+    parser.add_argument("--rader", type=int, default=2000)
+    parser.add_argument("--andel-pii", type=float, default=0.3)
+    parser.add_argument("--andel-ukjente-navn", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ut", type=Path, default=evaluering_mappe / "evaluering.json")
+    args = parser.parse_args()
+
+    resultater = kjør_evaluering(
+        args.nivaaer,
+        antall_rader=args.rader,
+        andel_pii=args.andel_pii,
+        andel_ukjente_navn=args.andel_ukjente_navn,
+        seed=args.seed,
+    )
+    print(tabell(resultater).to_string())
+    args.ut.parent.mkdir(parents=True, exist_ok=True)
+    args.ut.write_text(json.dumps(resultater, ensure_ascii=False, indent=2))
+    logging.info(f"Resultatene er lagret i {args.ut}")
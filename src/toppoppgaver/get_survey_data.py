@@ -84,7 +84,35 @@ def clean_survey_headers(dataframe: pd.DataFrame):
 
 
 # %%
-def merge_surveys():
+def merge_surveys(dataframes: list, survey_ids: list):
     """
-    TODO write function to merge surveys with similar questions for comparison
+    Merge surveys with the same questions into one dataframe for comparison
+
+    A column named survey is added last, holding the survey ID of each row,
+    so the other columns keep the positions they have in each survey.
+
+    Parameters:
+    -----------
+    dataframes: list
+        Dataframes with answers from each survey, without the question row
+    survey_ids: list
+        The survey ID of each dataframe
+
+    Returns
+    -------
+    merged: a dataframe with the answers from all the surveys
     """
+    if len(dataframes) != len(survey_ids):
+        raise ValueError("There must be one survey ID per dataframe")
+    columns = list(dataframes[0].columns)
+    for survey_id, df in zip(survey_ids, dataframes):
+        if list(df.columns) != columns:
+            raise ValueError(
+                f"Survey {survey_id} does not have the same questions as {survey_ids[0]}"
+            )
+    merged = pd.concat(dataframes, ignore_index=True)
+    merged["survey"] = pd.Categorical(
+        [i for i, df in zip(survey_ids, dataframes) for _ in range(len(df))],
+        categories=list(dict.fromkeys(survey_ids)),
+    )
+    return merged
@@ -0,0 +1,218 @@
+# %%
+import json
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+# %%
+standard_lager = Path("../../data/final/vasket.sqlite")
+
+
+# %%
+def rad_hash(df: pd.DataFrame, kolonner: list, konfig=""):
+    """
+    Lag en hash av fritekstcellene i hver rad
+
+    konfig tas med i hashen slik at endringer i vaskeoppsettet gir nye hasher
+    """
+    verdier = df[kolonner].astype(object).where(df[kolonner].notna(), None)
+    return pd.Series(
+        [
+            hashlib.sha1(
+                json.dumps([konfig, *rad], ensure_ascii=False, default=str).encode(
+                    "utf-8"
+                )
+            ).hexdigest()
+            for rad in verdier.itertuples(index=False, name=None)
+        ],
+        index=df.index,
+    )
+
+
+# %%
+class Sladdelager:
+    """Lokalt SQLite-lager med allerede vaskede fritekstsvar
+
+    Hver rad lagres med svar-id, hash av de uvaskede fritekstcellene og de
+    vaskede cellene og treffene per celle som JSON.
+
+    parameters:
+    -----------
+    filsti: Path
+        Stien til SQLite-filen. Opprettes dersom den ikke finnes
+    """
+
+    def __init__(self, filsti: Path = standard_lager):
+        filsti = Path(filsti)
+        filsti.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(filsti)
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS vasket (id TEXT PRIMARY KEY, hash TEXT, celler TEXT, treff TEXT)"
+        )
+        kolonner = [r[1] for r in self.con.execute("PRAGMA table_info(vasket)")]
+        if "treff" not in kolonner:
+            self.con.execute("ALTER TABLE vasket ADD COLUMN treff TEXT")
+
+    def hent(self, ids: list):
+        """
+        Returner {id: (hash, celler, treff)} for id-ene som finnes i lageret
+
+        treff er None for rader som ble lagret før treffene ble tatt med
+        """
+        ids = [str(i) for i in ids]
+        funnet = {}
+        for i in range(0, len(ids), 500):
+            bit = ids[i : i + 500]
+            rader = self.con.execute(
+                f"SELECT id, hash, celler, treff FROM vasket WHERE id IN ({','.join('?' * len(bit))})",
+                bit,
+            )
+            for id_, h, celler, treff in rader:
+                funnet[id_] = (h, json.loads(celler), treff and json.loads(treff))
+        return funnet
+
+    def lagre(
+        self,
+        df: pd.DataFrame,
+        kolonner: list,
+        hasher: pd.Series,
+        treff: pd.DataFrame = None,
+    ):
+        """
+        Lagre vaskede fritekstceller for radene i df, og eventuelt treffene per celle
+        """
+        verdier = df[kolonner].astype(object).where(df[kolonner].notna(), None)
+        rad_treff = {}
+        if treff is not None:
+            ents = [k for k in treff.columns if k != "kolonne"]
+            for indeks, kolonne, *antall in treff.itertuples(name=None):
+                rad_treff.setdefault(indeks, {})[kolonne] = dict(zip(ents, antall))
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO vasket (id, hash, celler, treff) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        str(id_),
+                        h,
+                        json.dumps(dict(zip(kolonner, rad)), default=str),
+                        (
+                            json.dumps(rad_treff.get(indeks, {}), default=int)
+                            if treff is not None
+                            else None
+                        ),
+                    )
+                    for indeks, id_, h, rad in zip(
+                        df.index,
+                        df["id"],
+                        hasher,
+                        verdier.itertuples(index=False, name=None),
+                    )
+                ],
+            )
+
+    def close(self):
+        self.con.close()
+
+
+# %%
+def _slå_sammen_treff(treff: list, kolonner: list):
+    """
+    Slå sammen treff fra lageret og nye treff til én tabell med heltall
+    """
+    if not treff:
+        return pd.DataFrame({"kolonne": pd.Categorical([], categories=kolonner)})
+    samlet = pd.concat(treff)
+    ents = [k for k in samlet.columns if k != "kolonne"]
+    samlet[ents] = samlet[ents].fillna(0).astype("int32")
+    samlet["kolonne"] = pd.Categorical(samlet["kolonne"], categories=kolonner)
+    return samlet
+
+
+# %%
+def sladd_inkrementelt(
+    df: pd.DataFrame,
+    kolonner: list,
+    sladd,
+    lager: Sladdelager,
+    konfig="",
+    med_treff=False,
+):
+    """Vasker bare svar som er nye eller endret siden forrige kjøring
+
+    Radene kjennes igjen på id og en hash av fritekstcellene. Uendrede rader
+    hentes fra lageret, resten sendes gjennom sladd og lagres.
+
+    parameters:
+    -----------
+    df: pd.dataframe
+        Dataframen med fritekstsvar som skal vaskes. Må ha kolonnen id
+    kolonner: list
+        Kolonnene med fritekst
+    sladd: callable
+        Funksjon som tar en dataframe og returnerer den vasket, f.eks. sladd_dataframe
+    lager: Sladdelager
+        Lageret med vaskede svar fra tidligere kjøringer
+    konfig: str
+        Beskrivelse av vaskeoppsettet, endringer gjør at alle svar vaskes på nytt
+    med_treff: bool
+        True dersom sladd også returnerer treffene per celle, se sladd_dataframe.
+        Da returneres treffene for alle radene sammen med dataframen
+    """
+    df = df.copy()
+    hasher = rad_hash(df, kolonner, konfig)
+    lagret = lager.hent(df["id"].tolist())
+    kjent = pd.Series(
+        [
+            str(id_) in lagret
+            and lagret[str(id_)][0] == h
+            and (not med_treff or lagret[str(id_)][2] is not None)
+            for id_, h in zip(df["id"], hasher)
+        ],
+        index=df.index,
+    )
+    logging.info(
+        f"{int(kjent.sum())} av {len(df)} svar er vasket tidligere, vasker {int((~kjent).sum())} nye eller endrede"
+    )
+
+    if kjent.any():
+        celler = pd.DataFrame(
+            [lagret[str(id_)][1] for id_ in df.loc[kjent, "id"]],
+            index=df.index[kjent],
+            columns=kolonner,
+        )
+        for kolonne in kolonner:
+            verdier = df[kolonne].astype(object)
+            verdier[kjent] = celler[kolonne]
+            df[kolonne] = verdier
+
+    treff = []
+    if med_treff and kjent.any():
+        rader = [
+            (indeks, {"kolonne": kolonne, **antall})
+            for indeks, id_ in zip(df.index[kjent], df.loc[kjent, "id"])
+            for kolonne, antall in lagret[str(id_)][2].items()
+        ]
+        if rader:
+            treff.append(
+                pd.DataFrame([r for _, r in rader], index=[i for i, _ in rader])
+            )
+
+    if (~kjent).any():
+        nye = sladd(df[~kjent])
+        nye_treff = None
+        if med_treff:
+            nye, nye_treff = nye
+            treff.append(nye_treff)
+        nye.index = df.index[~kjent]
+        for kolonne in kolonner:
+            verdier = df[kolonne].astype(object)
+            verdier[~kjent] = nye[kolonne]
+            df[kolonne] = verdier
+        lager.lagre(nye, kolonner, hasher[~kjent], nye_treff)
+
+    if med_treff:
+        return df, _slå_sammen_treff(treff, kolonner)
+    return df
@@ -0,0 +1,125 @@
+# %%
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# %%
+formater = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+# %%
+def _normaliser_type(pa, type_, kategorier=True):
+    """Gjør typene uavhengige av innholdet i første bit, slik at senere biter passer
+
+    Arrow IPC-filer kan ikke bytte ordbok for en kategorisk kolonne mellom
+    bitene, så der lagres kategoriene som vanlig tekst (kategorier=False).
+    """
+    if pa.types.is_null(type_):
+        return pa.string()
+    if pa.types.is_dictionary(type_):
+        verdi = _normaliser_type(pa, type_.value_type)
+        return pa.dictionary(pa.int32(), verdi) if kategorier else verdi
+    return type_
+
+
+# %%
+class Kolonneskriver:
+    """Skriver de vaskede svarene som Parquet eller Arrow IPC i biter
+
+    Kolonnetypene beholdes, også kategorier og tidspunkter. Spørsmålsteksten
+    fra label_questions lagres som metadata på hver kolonne og samlet i
+    skjemaet under nøkkelen "etiketter". Arrow-filen kan minnemappes med
+    pyarrow.memory_map og pyarrow.ipc.open_file.
+
+    parameters:
+    -----------
+    filsti: Path
+        Filen som skrives
+    format: str
+        "parquet" eller "arrow"
+    etiketter: dict
+        {kolonnenavn: spørsmålstekst}
+    """
+
+    def __init__(self, filsti: Path, format="parquet", etiketter: dict = None):
+        if format not in formater:
+            raise ValueError(
+                f"Ukjent eksportformat {format}, bruk et av {list(formater)}"
+            )
+        import pyarrow as pa
+
+        self.pa = pa
+        self.filsti = Path(filsti)
+        self.format = format
+        self.etiketter = etiketter or {}
+        self.skjema = None
+        self.skriver = None
+
+    def _lag_skjema(self, tabell):
+        pa = self.pa
+        felter = [
+            pa.field(
+                felt.name,
+                _normaliser_type(pa, felt.type, self.format == "parquet"),
+                metadata=(
+                    {"etikett": str(self.etiketter[felt.name])}
+                    if felt.name in self.etiketter
+                    else None
+                ),
+            )
+            for felt in tabell.schema
+        ]
+        return pa.schema(
+            felter,
+            metadata={
+                "etiketter": json.dumps(
+                    {k: str(v) for k, v in self.etiketter.items()}, ensure_ascii=False
+                )
+            },
+        )
+
+    def skriv(self, df: pd.DataFrame):
+        """
+        Legg til en bit med rader i filen
+        """
+        pa = self.pa
+        tabell = pa.Table.from_pandas(df, preserve_index=False)
+        if self.skriver is None:
+            self.skjema = self._lag_skjema(tabell)
+            self.filsti.parent.mkdir(parents=True, exist_ok=True)
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+
+                self.skriver = pq.ParquetWriter(self.filsti, self.skjema)
+            else:
+                self.skriver = pa.ipc.new_file(str(self.filsti), self.skjema)
+        self.skriver.write_table(tabell.cast(self.skjema))
+
+    def close(self):
+        if self.skriver is not None:
+            self.skriver.close()
+            self.skriver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# %%
+def les_etiketter(filsti: Path):
+    """
+    Les {kolonnenavn: spørsmålstekst} fra en fil skrevet med Kolonneskriver
+    """
+    import pyarrow.parquet as pq
+    import pyarrow as pa
+
+    filsti = Path(filsti)
+    if filsti.suffix == formater["parquet"]:
+        skjema = pq.read_schema(filsti)
+    else:
+        with pa.memory_map(str(filsti)) as kilde:
+            skjema = pa.ipc.open_file(kilde).schema
+    return json.loads(skjema.metadata[b"etiketter"])
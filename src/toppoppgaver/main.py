@@ -1,16 +1,26 @@
 # %%
 import os
-import json
+import argparse
 from pathlib import Path
 import logging
+from functools import partial
+from collections import Counter
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from taskanalytics_data_wrapper.taskanalytics_api import download_survey
 
-from navn import hent_fornavn, hent_etternavn, pyjstat_to_df
+from navn import hent_navneliste, navneliste_fil, ssb_url
+from nedlasting import lag_sesjon, last_ned_survey, samtidig, ta_url
 import ner_vask_opplysninger as ner
-from pretty_sheets import make_workbook, transform_dataframe_to_dict
+from navnematcher import hent_navnematcher
+from sladdecache import Sladdecache
+from inkrementell import Sladdelager, sladd_inkrementelt
+from profilering import Stegmaler
+from pretty_sheets import make_workbook
+from kolonneeksport import Kolonneskriver, formater
+from etterbehandling import les_skjema, skjema_fil, etterbehandle, kolonner_med
+from sjekkpunkt import Sjekkpunkter, stegene, lag_nøkkel, fil_nøkkel
 from get_survey_data import (
     get_survey_questions,
     return_open_answers,
@@ -22,76 +32,80 @@ load_dotenv()
 email = os.getenv("ta_email")
 password = os.getenv("ta_password")
 organization = os.getenv("ta_organization")
+# antall prosesser i NER-steget, 0 bruker alle kjerner
+ner_prosesser = int(os.getenv("ner_prosesser", "1")) or None
+# spacy-modellen eller modellnivået sm, md, lg eller regex, se evaluering.py for å velge
+ner_modell = os.getenv("ner_modell", ner.standard_modell)
+# vask bare svar som er nye eller endret siden forrige kjøring
+inkrementell = os.getenv("inkrementell", "0") == "1"
+# eventuell SQLite-fil der vaskede tekster caches mellom kjøringer
+cache_fil = os.getenv("sladdecache")
+# hvor mange dager navnelisten fra SSB gjenbrukes før den lastes ned på nytt
+navn_maks_alder_dager = int(os.getenv("navn_maks_alder_dager", "30"))
+# eventuelt navn på ett steg som skal profileres med cProfile
+profiler_steg = os.getenv("profiler_steg")
+# antall rader som leses og vaskes om gangen, 0 leser hele eksporten på én gang
+csv_bitstorrelse = int(os.getenv("csv_bitstorrelse", "0"))
+# formater de vaskede svarene skrives til, kommaseparert: xlsx, parquet og arrow
+eksportformat = os.getenv("eksportformat", "xlsx").split(",")
+# adressene til SSB og Task Analytics, kan settes til en lokal testserver
+ssb_url = os.getenv("ssb_url", ssb_url)
+ta_url = os.getenv("ta_url", ta_url)
+# lagre resultatet av hvert steg som sjekkpunkt, slik at en ny kjøring kan fortsette der forrige stoppet
+bruk_sjekkpunkter = os.getenv("sjekkpunkter", "0") == "1"
+# hva som gjøres med URL-, tids- og andre kolonner etter vaskingen, se etterbehandling.les_skjema
+kolonneskjema = les_skjema(os.getenv("kolonneskjema", skjema_fil))
+
+# TALL og ÅR fjerner tall som kan representere år, tlfnr eller beløp
+standard_ents = ["PER", "FNR", "TLF", "EPOST", "TALL", "ÅR", "finne", "andre"]
+# kolonneområdene med metadata og URLer som skjules i regnearket
+standard_skjulte_kolonner = kolonneskjema["skjulte_kolonner"]
 
 
 # %%
-def hent_navn():
-    """
-    Hent lister med fornavn og etternavn fra SSB
+def forbered_navn(sesjon=None):
     """
-    df = hent_fornavn()
-    with open("../../data/final/fornavn.json", "w", encoding="utf-8") as f:
-        json.dump(df.json(), f, ensure_ascii=False)
-    df = hent_etternavn()
-    with open("../../data/final/etternavn.json", "w", encoding="utf-8") as f:
-        json.dump(df.json(), f, ensure_ascii=False)
+    Henter sammenslåtte fornavn og etternavn fra SSB uten unntak
 
-
-def forbered_navn():
-    """
-    Slår sammen fornavn og etternavn fra SSB og fjerner unntak
+    Bruker lokalt øyeblikksbilde av navnelisten dersom det er ferskt nok
     """
-    fornavn = pyjstat_to_df(Path("../../data/final/fornavn.json"))
-    fornavn_unik = [_ for _ in fornavn["fornavn"].unique()]
-    fornavn_små = [item.lower() for item in fornavn_unik]
-    etternavn = pyjstat_to_df(Path("../../data/final/etternavn.json"))
-    etternavn = etternavn[
-        ~etternavn["etternavn"].isin(["A-F", "G-K", "L-R", "S-Å"])
-    ]  # drop alfabetrekken
-    etternavn_unik = [_ for _ in etternavn["etternavn"].unique()]
-    etternavn_små = [item.lower() for item in etternavn_unik]
-    navn = fornavn_små + etternavn_små
-    # ignorer navn som forveksles med substantiv og verb
-    with open("../patterns/unntak.txt") as f:
-        unntak = [line.rstrip() for line in f]
-    navn = [n for n in navn if n not in unntak]
-    return navn
+    return hent_navneliste(
+        navneliste_fil,
+        maks_alder_dager=navn_maks_alder_dager,
+        sesjon=sesjon,
+        url=ssb_url,
+    )
 
 
 # %%
-def kun_fritekstsvar(df: pd.DataFrame, kolonner):
+def last_ned(sesjon, survey_id: str, filsti: Path):
     """
-    Lag en dataframe med kun rader som inneholder fritekstsvar
+    Last ned svarene fra én undersøkelse i Task Analytics
     """
-    fritekst = dict(zip(kolonner, [df[~df[x].isna()] for x in kolonner]))
-    fritekstsvar = pd.concat(fritekst.values(), ignore_index=True).drop_duplicates()
-    return fritekstsvar
+    return last_ned_survey(
+        sesjon,
+        username=email,
+        password=password,
+        survey_id=survey_id,
+        filsti=filsti,
+        url=ta_url,
+    )
 
 
 # %%
-def vask_urler(df: pd.DataFrame, urler=list):
+def fritekst_maske(df: pd.DataFrame, kolonner):
     """
-    vask urler i en dataframe. send inn en dataframe og en liste med variabelnavn som inneholder URLer.
+    Returner en boolsk serie som er True for rader som inneholder fritekstsvar
     """
-    for i in urler:
-        df[i].replace(
-            to_replace=r"[0-9a-z.-]{36}", value="ANONYMISERT", regex=True, inplace=True
-        )
-        df[i].replace(
-            to_replace=r"\d{5,}", value="ANONYMISERT", regex=True, inplace=True
-        )
-    return df
+    return df[kolonner].notna().any(axis=1)
 
 
 # %%
-def runde_timer(df: pd.DataFrame, tid=list):
+def kun_fritekstsvar(df: pd.DataFrame, kolonner):
     """
-    Aggreger til nærmeste time
+    Lag en dataframe med kun rader som inneholder fritekstsvar
     """
-    for i in tid:
-        df[i] = pd.to_datetime(df[i])
-        df[i] = df[i].dt.round("H")
-    return df
+    return df[fritekst_maske(df, kolonner)]
 
 
 # %%
@@ -108,109 +122,488 @@ def find_substring_regex(regex: str, df: pd.DataFrame, case=False):
 
 
 # %%
-def main():
+def les_sporsmal(filsti: Path):
     """
-    Kjører hele programmet i flere steg
-    * Laster ned svarene fra spørreundersøkelsen
-    * Markerer spørsmålene og svarene som kategoriske eller fritekst
-    * Vasker datasettet for kjente navn i SSBs navnelister
-    * Vasker datasettet med Name entity recognition (NER) fra Spacy
-    * Bytter ut resterende tall som ligner år og beløp
-    * Vasker URLer for unike IDer
-    * Runder klokkeslett i svarene til nærmeste time
-    * Teller treff på navn blant svarene
-    * Lager formatert regneark til deling
-    """
-    logging.info(f"Laster ned navnelister fra SSB 📊")
-    hent_navn()
-    logging.info(f"Forbereder navnelister for vask")
-    navn = forbered_navn()
-    logging.info(f"Laster ned svar fra spørreundersøkelsen 💾")
-    download_survey(
-        username=email,
-        password=password,
-        survey_id="03381",
-        filename="../../data/final/new_survey.csv",
-    )
-    df = pd.read_csv(Path("../../data/final/new_survey.csv"))
-    questions = get_survey_questions(df)
+    Les kolonnenavnene og spørsmålsraden øverst i eksporten fra Task Analytics
+    """
+    header = pd.read_csv(filsti, nrows=1, dtype=str)
+    return get_survey_questions(header)
+
+
+# %%
+def les_oppsett(filsti: Path):
+    """
+    Les kolonnene, fritekstkolonnene og spørsmålsteksten per kolonne fra eksporten
+    """
+    questions = les_sporsmal(filsti)
     questions_labelled = label_questions(questions)
+    kolonner = list(questions)
+    kun_fritekst = return_open_answers(pd.DataFrame(columns=kolonner))
+    kategoriske = list(set(kolonner) - set(kun_fritekst))
+    etiketter = dict(
+        zip(
+            kolonner + ["inneholder"],
+            kolonnenavn(kolonner + ["inneholder"], kategoriske, questions_labelled),
+        )
+    )
+    return {"kolonner": kolonner, "kun_fritekst": kun_fritekst, "etiketter": etiketter}
 
-    df = df.iloc[1:]
-    kun_fritekst = return_open_answers(df)
-    kategoriske = list(set(df.columns) - set(kun_fritekst))
-    fritekstsvar = kun_fritekstsvar(df, kolonner=kun_fritekst)
-    kategorisvar = df[~df.id.isin(fritekstsvar.id)]
-    fritekstsvar["inneholder"] = "Ja"
-    kategorisvar["inneholder"] = "Nei"
-    ny_df = fritekstsvar.copy()
-    logging.info("Vask datasettet 🧹")
-    for i, v in enumerate(kun_fritekst, start=1):
-        logging.info(f"Vasker nå spørsmål nr {i}: {v}")
-        ny_df = ner.sladd_tekster(
-            df=ny_df,
-            ents_list=["PER", "FNR", "TLF", "EPOST", "finne", "andre"],
-            ekstra_vask_av_navn=True,
-            text_col_input=v,
-            term_liste=navn,
+
+# %%
+def kolonnetyper(kolonner: list, kun_fritekst: list):
+    """
+    Faste datatyper for eksporten: kategorisvar som category og resten som tekst
+    """
+    return {
+        k: "category" if k.startswith("answers.") and k not in kun_fritekst else str
+        for k in kolonner
+    }
+
+
+# %%
+def kolonnenavn(kolonner: list, kategoriske: list, questions_labelled: list):
+    """
+    Gi kolonnene spørsmålsteksten og markér dem som fritekst eller kategori
+    """
+    navn = [
+        f"{i} fritekst" if i not in kategoriske else f"{i} kategori" for i in kolonner
+    ]
+    # rename columns after categorization and cleaning
+    return [
+        questions_labelled[i] if i < len(questions_labelled) else n
+        for i, n in enumerate(navn)
+    ]
+
+
+# %%
+def vask_svar(df: pd.DataFrame, kun_fritekst: list, sladd, maler: Stegmaler):
+    """
+    Vasker svarene i en dataframe uten spørsmålsraden
+
+    * Markerer svarene som inneholder fritekst
+    * Vasker fritekstsvarene med sladd
+
+    Returnerer de vaskede svarene, antall fritekstsvar, antall svar med treff
+    og antall treff per entitet. Treffene telles mens tekstene vaskes, se
+    ner_vask_opplysninger.sladd_dataframe
+    """
+    # radene beholder rekkefølge og indeks slik at vasket tekst kan skrives rett tilbake
+    maske = fritekst_maske(df, kun_fritekst)
+    df["inneholder"] = np.where(maske, "Ja", "Nei")
+    ny_df, treff = sladd(df[maske])
+    # skriv vasket fritekst tilbake til radene blant alle svarene
+    df.loc[maske, kun_fritekst] = ny_df[kun_fritekst]
+    siste = df.reset_index(drop=True)
+
+    with maler.steg("telling av treff", antall=len(treff)):
+        ents = [k for k in treff.columns if k != "kolonne"]
+        per_entitet = treff[ents].sum()
+        # svar med treff på personopplysninger, ikke bare tall og år
+        viktige = [k for k in ["PER", "FNR", "TLF", "EPOST"] if k in ents]
+        per_svar = treff[viktige].sum(axis=1).groupby(level=0).sum()
+    return (
+        siste,
+        int(maske.sum()),
+        int((per_svar > 0).sum()),
+        {k: int(v) for k, v in per_entitet.items()},
+    )
+
+
+# %%
+def lag_sladd(
+    navn: list,
+    kun_fritekst: list,
+    cache: Sladdecache,
+    maler: Stegmaler,
+    lager: Sladdelager = None,
+    fingeravtrykk="",
+):
+    """
+    Lag funksjonen som vasker fritekstkolonnene i en bit av svarene
+    """
+    sladd = partial(
+        ner.sladd_dataframe,
+        columns=kun_fritekst,
+        ents_list=standard_ents,
+        ekstra_vask_av_navn=True,
+        term_liste=navn,
+        n_process=ner_prosesser,
+        modell=ner_modell,
+        cache=cache,
+        maler=maler,
+        med_treff=True,
+    )
+    if lager is not None:
+        sladd = partial(
+            sladd_inkrementelt,
+            kolonner=kun_fritekst,
+            sladd=sladd,
+            lager=lager,
+            konfig=fingeravtrykk,
+            med_treff=True,
         )
-    logging.info(f"Datasettet er vasket og klart til å hentes 🧼 🪣")
-    # fjern tall som kan representere år, tlfnr eller beløp
-    for i in kun_fritekst:
-        ny_df[i].replace(to_replace="\d{5,}", value="TALL", regex=True, inplace=True)
-    for i in kun_fritekst:
-        ny_df[i].replace(to_replace="\d{4}", value="ÅR", regex=True, inplace=True)
-    # slå sammen med kategorisvar
-    siste = pd.concat([ny_df, kategorisvar], ignore_index=True)
-    siste = vask_urler(df=siste, urler=["startUrl", "doneUrl"])
-    siste = runde_timer(df=siste, tid=["start", "complete", "done"])
-
-    treff = find_substring_regex(r"\s(PER|FNR|TLF|EPOST)\s", siste)
+    return sladd
 
-    logging.info(
-        f"Andelen fritekstsvar av alle svar er {len(fritekstsvar) / len(siste) * 100:.3f}%"
+
+# %%
+def lag_cache(navn: list):
+    """
+    Lag cachen for vaskede tekster og fingeravtrykket av vaskeoppsettet
+    """
+    fingeravtrykk = ner.vask_fingeravtrykk(
+        standard_ents,
+        ner_modell,
+        hent_navnematcher(navn),
+        ner.forfilter_regler,
+    )
+    return fingeravtrykk, Sladdecache(fingeravtrykk, filsti=cache_fil)
+
+
+# %%
+def eksporter(
+    biter,
+    filstamme: Path,
+    etiketter: dict,
+    maler: Stegmaler,
+    hide_columns=standard_skjulte_kolonner,
+):
+    """Skriv bitene med vaskede svar til formatene i eksportformat
+
+    Bitene leses bare én gang, og hver bit skrives til alle formatene før
+    neste bit hentes.
+
+    parameters:
+    -----------
+    biter: iterator
+        Dataframes med vaskede svar
+    filstamme: Path
+        Filsti uten filendelse, f.eks. ../../data/write_dict
+    etiketter: dict
+        {kolonnenavn: spørsmålstekst}, se kolonnenavn
+    maler: Stegmaler
+        Måler for tid og minne
+    hide_columns: list
+        Kolonneområder som skjules i regnearket
+    """
+    ukjente = set(eksportformat) - {"xlsx", *formater}
+    if ukjente:
+        raise ValueError(f"Ukjent eksportformat {', '.join(sorted(ukjente))}")
+    filstamme = Path(filstamme)
+    skrivere = [
+        Kolonneskriver(
+            filstamme.with_suffix(formater[format]),
+            format=format,
+            etiketter=etiketter,
+        )
+        for format in eksportformat
+        if format in formater
+    ]
+
+    antall = {"rader": 0}
+
+    def eksporterte_biter():
+        for bit in biter:
+            for skriver in skrivere:
+                skriver.skriv(bit)
+            antall["rader"] += len(bit)
+            yield bit
+
+    def rader():
+        for bit in eksporterte_biter():
+            yield from bit.itertuples(index=False, name=None)
+
+    with maler.steg("vask og eksport") as s:
+        if "xlsx" in eksportformat:
+            make_workbook(
+                data=rader(),
+                columns=list(etiketter.values()),
+                path=filstamme.with_suffix(".xlsx"),
+                autofilter=True,
+                hide=True,
+                hide_columns=hide_columns,
+                background_color="#F8F1EC",
+            )
+        else:
+            for _ in eksporterte_biter():
+                pass
+        s["antall"] = antall["rader"]
+        for skriver in skrivere:
+            skriver.close()
+
+
+# %%
+def vask_survey(
+    survey_fil: Path,
+    navn: list,
+    cache: Sladdecache,
+    maler: Stegmaler,
+    filstamme: Path = Path("../../data/write_dict"),
+    lager: Sladdelager = None,
+    fingeravtrykk="",
+    hide_columns=None,
+    samle: list = None,
+    skjema: dict = kolonneskjema,
+    sjekkpunkter: Sjekkpunkter = None,
+):
+    """Vasker én eksport fra Task Analytics og skriver resultatet
+
+    Dersom csv_bitstorrelse er satt leses og vaskes svarene i biter med så
+    mange rader, og hver bit skrives før neste leses.
+
+    parameters:
+    -----------
+    survey_fil: Path
+        CSV-eksporten med spørsmålsraden øverst
+    navn: list
+        Navnelisten fra SSB
+    cache: Sladdecache
+        Cache for vaskede tekster, se lag_cache
+    maler: Stegmaler
+        Måler for tid og minne
+    filstamme: Path
+        Filsti uten filendelse for resultatet
+    lager: Sladdelager
+        Eventuelt lager med vaskede svar fra tidligere kjøringer
+    fingeravtrykk: str
+        Fingeravtrykket av vaskeoppsettet, se lag_cache
+    hide_columns: list
+        Kolonneområder som skjules i regnearket. Dersom dette ikke angis
+        brukes skjulte_kolonner fra skjemaet
+    samle: list
+        Dersom en liste angis legges hver bit med vaskede svar også til der
+    skjema: dict
+        Kolonneskjemaet for etterbehandlingen, se etterbehandling.les_skjema
+    sjekkpunkter: Sjekkpunkter
+        Eventuelle sjekkpunkter for stegene svar, sladdet og etterbehandlet.
+        Steg som kan gjenbrukes leses fra sjekkpunktet i stedet for å kjøres
+
+    Returns
+    -------
+    telling: dictionary med antall svar, fritekstsvar og svar med treff
+    per_entitet: Counter med antall treff per entitet
+    etiketter: dictionary med spørsmålsteksten for hver kolonne
+    """
+    svar_gjenbrukes = sjekkpunkter is not None and sjekkpunkter.kan_gjenbrukes("svar")
+    oppsett = sjekkpunkter.info("svar") if svar_gjenbrukes else les_oppsett(survey_fil)
+    kolonner = oppsett["kolonner"]
+    kun_fritekst = oppsett["kun_fritekst"]
+    etiketter = dict(oppsett["etiketter"])
+    les_csv = partial(
+        pd.read_csv,
+        survey_fil,
+        skiprows=[1],
+        dtype=kolonnetyper(kolonner, kun_fritekst),
+    )
+    sladd = lag_sladd(navn, kun_fritekst, cache, maler, lager, fingeravtrykk)
+
+    telling = {"svar": 0, "fritekstsvar": 0, "treff": 0}
+    per_entitet = Counter()
+    gjenbrukt = set()
+
+    def kjør_steg(steg: str, nøkkel: str, lag_biter, info=None):
+        # kjør steget helt og lagre sjekkpunktet før neste steg leser fra det,
+        # slik at sjekkpunktet er gyldig selv om et senere steg feiler
+        if sjekkpunkter is None:
+            return lag_biter()
+        if sjekkpunkter.kan_gjenbrukes(steg, nøkkel):
+            logging.info(f"Bruker sjekkpunktet for steget {steg}")
+            gjenbrukt.add(steg)
+        else:
+            sjekkpunkter.lagre(steg, nøkkel, lag_biter(), etiketter, info)
+        return sjekkpunkter.les(steg, csv_bitstorrelse)
+
+    def rå_biter():
+        if csv_bitstorrelse:
+            yield from les_csv(chunksize=csv_bitstorrelse)
+        else:
+            with maler.steg("les csv"):
+                alle = les_csv()
+            yield alle
+
+    def sladdede_biter(biter):
+        for bit in biter:
+            siste, antall_fritekst, antall_treff, treff = vask_svar(
+                bit, kun_fritekst, sladd, maler
+            )
+            per_entitet.update(treff)
+            telling["svar"] += len(siste)
+            telling["fritekstsvar"] += antall_fritekst
+            telling["treff"] += antall_treff
+            logging.info(f"{telling['svar']} svar er vasket")
+            yield siste
+
+    def etterbehandlede_biter(biter):
+        antall = 0
+        for siste in biter:
+            with maler.steg("etterbehandling", antall=len(siste)):
+                siste = etterbehandle(siste, skjema)
+            siste["id"] = range(antall + 1, antall + len(siste) + 1)
+            antall += len(siste)
+            yield siste
+
+    def samlede_biter(biter):
+        for bit in biter:
+            if samle is not None:
+                samle.append(bit)
+            yield bit
+
+    # nøklene til sjekkpunktene er en hash av eksporten og oppsettet for hvert steg
+    svar_nøkkel = sladdet_nøkkel = etterbehandlet_nøkkel = None
+    if sjekkpunkter is not None:
+        svar_nøkkel = (
+            sjekkpunkter.nøkkel("svar") if svar_gjenbrukes else fil_nøkkel(survey_fil)
+        )
+        sladdet_nøkkel = lag_nøkkel(svar_nøkkel, fingeravtrykk, kun_fritekst)
+        etterbehandlet_nøkkel = lag_nøkkel(sladdet_nøkkel, skjema)
+
+    biter = kjør_steg(
+        "etterbehandlet",
+        etterbehandlet_nøkkel,
+        lambda: etterbehandlede_biter(
+            kjør_steg(
+                "sladdet",
+                sladdet_nøkkel,
+                lambda: sladdede_biter(
+                    kjør_steg("svar", svar_nøkkel, rå_biter, info=oppsett)
+                ),
+                info={"telling": telling, "per_entitet": per_entitet},
+            )
+        ),
+    )
+
+    for kolonne in kolonner_med(skjema, "fjern", etiketter):
+        del etiketter[kolonne]
+    if hide_columns is None:
+        hide_columns = skjema["skjulte_kolonner"]
+    eksporter(samlede_biter(biter), filstamme, etiketter, maler, hide_columns)
+
+    if gjenbrukt & {"sladdet", "etterbehandlet"}:
+        # svarene ble ikke vasket i denne kjøringen, tellingen er lagret i sjekkpunktet
+        info = sjekkpunkter.info("sladdet")
+        telling = info["telling"]
+        per_entitet = Counter(info["per_entitet"])
+    return telling, per_entitet, etiketter
+
+
+# %%
+def logg_statistikk(telling: dict, per_entitet: Counter, maler: Stegmaler):
+    """
+    Logg andelen fritekstsvar og treff, og legg treffene per entitet i rapporten
+    """
+    svar, fritekstsvar, treff = (
+        telling["svar"],
+        telling["fritekstsvar"],
+        telling["treff"],
     )
     logging.info(
-        f"Det tilsvarer {len(fritekstsvar)} fritekstsvar blant {(len(siste))} svar totalt"
+        f"Andelen fritekstsvar av alle svar er {fritekstsvar / svar * 100:.3f}%"
     )
+    logging.info(f"Det tilsvarer {fritekstsvar} fritekstsvar blant {svar} svar totalt")
     logging.info(
-        f"Andelen svar som inneholder treff på NER er {len(treff) / len(siste) * 100:.3f}%"
+        f"Andelen svar som inneholder treff på NER er {treff / svar * 100:.3f}%"
     )
-    logging.info(f"Det tilsvarer {(len(treff))} treff blant {(len(siste))} svar totalt")
+    logging.info(f"Det tilsvarer {treff} treff blant {svar} svar totalt")
     logging.info(
-        f"Andelen treff blant alle fritekstsvar er {len(treff)/len(fritekstsvar) * 100:.3f}%"
+        f"Andelen treff blant alle fritekstsvar er {treff / fritekstsvar * 100:.3f}%"
     )
     logging.info(
-        f"Det tilsvarer {(len(treff))} treff blant {(len(fritekstsvar))} fritekstsvar totalt"
+        f"Det tilsvarer {treff} treff blant {fritekstsvar} fritekstsvar totalt"
     )
+    with maler.steg("treff per entitet") as s:
+        s.update(per_entitet)
+    logging.info(f"Antall sladdede entiteter: {dict(per_entitet)}")
 
-    new_ids = range(1, len(siste) + 1)
-    siste["id"] = new_ids
-    siste.columns = [
-        f"{i} fritekst" if i not in kategoriske else f"{i} kategori"
-        for i in siste.columns
-    ]
-    siste.columns
-    siste.rename(
-        columns=dict(zip(siste.columns, questions_labelled)), inplace=True
-    )  # rename columns after categorization and cleaning
 
-    df2 = transform_dataframe_to_dict(siste)
+# %%
+def main(fra_steg: str = None):
+    """
+    Kjører hele programmet i flere steg
+    * Laster ned navnelister fra SSB og svarene fra spørreundersøkelsen samtidig
+    * Markerer spørsmålene og svarene som kategoriske eller fritekst
+    * Vasker datasettet for kjente navn i SSBs navnelister
+      (bare nye og endrede svar dersom inkrementell er satt)
+    * Vasker datasettet med Name entity recognition (NER) fra Spacy
+    * Bytter ut resterende tall som ligner år og beløp
+    * Vasker URLer for unike IDer og runder klokkeslett i svarene til
+      nærmeste time etter kolonneskjemaet
+    * Teller treff per entitet mens svarene vaskes
+    * Lager formatert regneark og eventuelt Parquet- eller Arrow-fil til deling
+    * Lagrer tid og minne per steg i en JSON-rapport
+
+    Dersom sjekkpunkter er satt, eller fra_steg er angitt, lagres resultatet
+    av stegene navn, svar, sladdet og etterbehandlet som sjekkpunkter, og en
+    ny kjøring fortsetter fra siste gyldige sjekkpunkt. Med fra_steg kjøres
+    bare fra_steg og stegene etter på nytt, se sjekkpunkt.Sjekkpunkter.
+
+    Se batch.py for å vaske flere undersøkelser i samme kjøring.
+    """
+    maler = Stegmaler(profiler_steg=profiler_steg)
+    sjekkpunkter = (
+        Sjekkpunkter(fra_steg=fra_steg) if bruk_sjekkpunkter or fra_steg else None
+    )
+    logging.info(f"Henter navnelister fra SSB og svar fra spørreundersøkelsen 📊💾")
+    survey_fil = Path("../../data/final/new_survey.csv")
+    sesjon = lag_sesjon()
+    oppgaver = {
+        "navn": partial(forbered_navn, sesjon),
+        "svar": partial(last_ned, sesjon, "03381", survey_fil),
+    }
+    if sjekkpunkter is not None:
+        oppgaver = {
+            steg: oppgave
+            for steg, oppgave in oppgaver.items()
+            if not sjekkpunkter.kan_gjenbrukes(steg)
+        }
+    with maler.steg("nedlasting") as s:
+        # navnene og svarene lastes ned samtidig på samme sesjon
+        hentet = samtidig(oppgaver) if oppgaver else {}
+        if "navn" in hentet:
+            navn = hentet["navn"]
+            if sjekkpunkter is not None:
+                sjekkpunkter.lagre(
+                    "navn", lag_nøkkel(navn), [pd.DataFrame({"navn": navn})]
+                )
+        else:
+            logging.info("Bruker sjekkpunktet for steget navn")
+            navn = next(sjekkpunkter.les("navn"))["navn"].tolist()
+        s["antall"] = len(navn)
 
-    make_workbook(
-        data=df2,
-        path=Path("../../data/write_dict.xlsx"),
-        autofilter=True,
-        last_row=len(siste),
-        last_col=len(siste.columns),
-        hide=True,
-        hide_columns=["B:E", "AB:AG"],
-        background_color="#F8F1EC",
+    logging.info("Vask datasettet 🧹")
+    fingeravtrykk, cache = lag_cache(navn)
+    lager = Sladdelager() if inkrementell else None
+    telling, per_entitet, _ = vask_survey(
+        survey_fil,
+        navn,
+        cache,
+        maler,
+        lager=lager,
+        fingeravtrykk=fingeravtrykk,
+        sjekkpunkter=sjekkpunkter,
     )
-    logging.info(f"Regnearket er klart 🧺")
+    cache.close()
+    if lager is not None:
+        lager.close()
+    logging.info(f"Datasettet er vasket og klart til å hentes 🧼 🪣")
+    logging.info(f"Eksporten er klar i {', '.join(eksportformat)} 🧺")
+
+    logg_statistikk(telling, per_entitet, maler)
+    rapport = maler.skriv_rapport()
+    logging.info(f"Rapport med tid og minne per steg er lagret i {rapport}")
+    if sjekkpunkter is not None:
+        sjekkpunkter.ferdig()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Last ned, vask og eksporter svarene fra toppoppgaver"
+    )
+    parser.add_argument(
+        "--fra-steg",
+        "--from-stage",
+        choices=stegene,
+        help="kjør dette steget og stegene etter på nytt, og les de tidligere fra sjekkpunktene",
+    )
+    args = parser.parse_args()
+    main(fra_steg=args.fra_steg)
 
 # %%
@@ -1,63 +1,82 @@
 # %%
 import json
+import time
+import logging
 from pathlib import Path
 
 import requests
 
 from pyjstat import pyjstat
 
+from navnematcher import les_unntak
+from nedlasting import lag_sesjon, last_ned_json, samtidig, standard_timeout
 
 # %%
-def hent_fornavn():
+navneliste_fil = Path("../../data/final/navn.txt")
+# aggregerte kategorier i etternavnstabellen som ikke er navn
+alfabetrekker = ["A-F", "G-K", "L-R", "S-Å"]
+
+
+# %%
+ssb_url = "https://data.ssb.no/api/v0/no/table"
+# rå json-stat fra SSB lagres her før navnene hentes ut
+ssb_mappe = Path("../../data/raw/")
+
+fornavn_sporring = {
+    "query": [
+        {"code": "Fornavn", "selection": {"filter": "all", "values": ["*"]}},
+        {
+            "code": "ContentsCode",
+            "selection": {"filter": "item", "values": ["Personer"]},
+        },
+        {
+            "code": "Tid",
+            "selection": {
+                "filter": "item",
+                "values": ["2013", "2014", "2015", "2020", "2021"],
+            },
+        },
+    ],
+    "response": {"format": "json-stat2"},
+}
+etternavn_sporring = {
+    "query": [
+        {"code": "Etternavn", "selection": {"filter": "all", "values": ["*"]}},
+        {
+            "code": "ContentsCode",
+            "selection": {"filter": "item", "values": ["Personer"]},
+        },
+        {
+            "code": "Tid",
+            "selection": {
+                "filter": "item",
+                "values": ["2018", "2019", "2020", "2021"],
+            },
+        },
+    ],
+    "response": {"format": "json-stat2"},
+}
+
+
+# %%
+def hent_fornavn(sesjon: requests.Session = None, url=ssb_url):
     """
     Hent alle fornavn fra ssb for begge kjønn
     """
-    url = "https://data.ssb.no/api/v0/no/table/10501"
-    data = {
-        "query": [
-            {"code": "Fornavn", "selection": {"filter": "all", "values": ["*"]}},
-            {
-                "code": "ContentsCode",
-                "selection": {"filter": "item", "values": ["Personer"]},
-            },
-            {
-                "code": "Tid",
-                "selection": {
-                    "filter": "item",
-                    "values": ["2013", "2014", "2015", "2020", "2021"],
-                },
-            },
-        ],
-        "response": {"format": "json-stat2"},
-    }
-    d = requests.post(url, json=data)
+    d = (sesjon or requests).post(
+        f"{url}/10501", json=fornavn_sporring, timeout=standard_timeout
+    )
     return d
 
 
 # %%
-def hent_etternavn():
+def hent_etternavn(sesjon: requests.Session = None, url=ssb_url):
     """
     Hent alle etternavn fra ssb for begge kjønn
     """
-    url = "https://data.ssb.no/api/v0/no/table/12891"
-    data = {
-        "query": [
-            {"code": "Etternavn", "selection": {"filter": "all", "values": ["*"]}},
-            {
-                "code": "ContentsCode",
-                "selection": {"filter": "item", "values": ["Personer"]},
-            },
-            {
-                "code": "Tid",
-                "selection": {
-                    "filter": "item",
-                    "values": ["2018", "2019", "2020", "2021"],
-                },
-            },
-        ],
-        "response": {"format": "json-stat2"},
-    }
-    r = requests.post(url, json=data)
+    r = (sesjon or requests).post(
+        f"{url}/12891", json=etternavn_sporring, timeout=standard_timeout
+    )
     return r
 
 
@@ -72,3 +91,99 @@ def pyjstat_to_df(filsti: Path):
         dataset = pyjstat.Dataset.read(s)
         df = dataset.write("dataframe")
     return df
+
+
+# %%
+def navn_fra_jsonstat(data: dict, dimensjon: str):
+    """
+    Hent navnene direkte fra kategoriene i en json-stat2-respons fra SSB
+    """
+    return list(data["dimension"][dimensjon]["category"]["label"].values())
+
+
+# %%
+def lag_navneliste(fornavn: list, etternavn: list, unntak: list):
+    """
+    Slå sammen fornavn og etternavn til en sortert liste med unike navn i små bokstaver uten unntak
+    """
+    etternavn = [n for n in etternavn if n not in alfabetrekker]
+    unntak = set(unntak)
+    navn = {n.lower() for n in fornavn + etternavn}
+    return sorted(n for n in navn if n and n not in unntak)
+
+
+# %%
+def fjern_unntak(navn: list, unntak: list):
+    """
+    Fjern ordene i unntak fra navnelisten
+    """
+    unntak = set(unntak)
+    return [n for n in navn if n not in unntak]
+
+
+# %%
+def hent_navneliste(
+    filsti: Path = navneliste_fil,
+    maks_alder_dager=30,
+    sesjon: requests.Session = None,
+    url=ssb_url,
+    mappe: Path = ssb_mappe,
+):
+    """Hent navnelisten fra et lokalt øyeblikksbilde
+
+    Laster ned fornavn og etternavn fra SSB på nytt bare dersom øyeblikksbildet
+    mangler eller er eldre enn maks_alder_dager. De to tabellene lastes ned
+    samtidig. Dersom nedlastingen feiler brukes et eldre øyeblikksbilde hvis
+    det finnes. Øyeblikksbildet lagres uten at unntakene er fjernet, og
+    unntak.txt leses hver gang, slik at endringer i unntakene gjelder med en gang.
+
+    parameters:
+    -----------
+    filsti: Path
+        Tekstfil med ett navn per linje
+    maks_alder_dager: int
+        Hvor mange dager øyeblikksbildet kan brukes før det lastes ned på nytt
+    sesjon: requests.Session
+        Sesjonen som brukes til nedlastingen, se nedlasting.lag_sesjon
+    url: str
+        Adressen til SSBs tabell-API, kan byttes ut med en lokal testserver
+    mappe: Path
+        Mappen der svarene fra SSB lagres
+    """
+    filsti = Path(filsti)
+    if filsti.exists():
+        alder = time.time() - filsti.stat().st_mtime
+        if alder < maks_alder_dager * 24 * 60 * 60:
+            return fjern_unntak(
+                filsti.read_text(encoding="utf-8").splitlines(), les_unntak()
+            )
+
+    sesjon = sesjon or lag_sesjon()
+    mappe = Path(mappe)
+    try:
+        data = samtidig(
+            {
+                "Fornavn": lambda: last_ned_json(
+                    sesjon, f"{url}/10501", mappe / "fornavn.json", fornavn_sporring
+                ),
+                "Etternavn": lambda: last_ned_json(
+                    sesjon, f"{url}/12891", mappe / "etternavn.json", etternavn_sporring
+                ),
+            }
+        )
+        fornavn = navn_fra_jsonstat(data["Fornavn"], "Fornavn")
+        etternavn = navn_fra_jsonstat(data["Etternavn"], "Etternavn")
+    except (requests.RequestException, ValueError, KeyError) as e:
+        if filsti.exists():
+            logging.warning(f"Kunne ikke laste ned navn fra SSB, bruker {filsti}: {e}")
+            return fjern_unntak(
+                filsti.read_text(encoding="utf-8").splitlines(), les_unntak()
+            )
+        raise
+
+    navn = lag_navneliste(fornavn, etternavn, [])
+    filsti.parent.mkdir(parents=True, exist_ok=True)
+    tmp = filsti.with_suffix(".tmp")
+    tmp.write_text("\n".join(navn), encoding="utf-8")
+    tmp.replace(filsti)
+    return fjern_unntak(navn, les_unntak())
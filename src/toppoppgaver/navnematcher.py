@@ -0,0 +1,216 @@
+# %%
+import gc
+import hashlib
+import logging
+import pickle
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from flashtext import KeywordProcessor
+
+# %%
+unntak_fil = Path("../patterns/unntak.txt")
+cache_mappe = Path("../../data/cache/")
+
+# navnematchere som allerede er bygget i denne prosessen, nøkkel er fingeravtrykket
+_matchere = {}
+# fingeravtrykket for navnelister som allerede er sett i denne prosessen, slik at
+# et nytt kall med samme liste slipper å sortere navnene og lese unntakene
+_nøkler = {}
+
+
+# %%
+@contextmanager
+def uten_gc():
+    """
+    Slå av søppelinnsamlingen mens trien bygges eller (av)pickles
+
+    Trien er hundretusenvis av små dicts, og gc bruker ellers mesteparten
+    av tiden på å gå gjennom dem uten å finne noe å rydde.
+    """
+    var_på = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if var_på:
+            gc.enable()
+
+
+# %%
+def les_unntak(filsti: Path = unntak_fil):
+    """
+    Les listen med ord som ikke skal regnes som navn
+    """
+    with open(filsti, encoding="utf-8") as f:
+        return [line.rstrip() for line in f if line.strip()]
+
+
+# %%
+def fingeravtrykk(term_liste: list, unntak: list, replacement="PER"):
+    """
+    Lag en hash av alt som påvirker navnematcheren, brukes som nøkkel i cachen
+    """
+    h = hashlib.sha256()
+    for del_liste in (sorted(set(term_liste)), sorted(set(unntak)), [replacement]):
+        h.update("\n".join(del_liste).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+# %%
+class Navnematcher:
+    """Gjenbrukbar sladding og uttrekk av navn fra SSB-navnelister vha. flashtext
+
+    Bygges én gang per prosess med hent_navnematcher og kan lagres til disk,
+    slik at senere kjøringer og arbeidsprosesser slipper å bygge trien på nytt.
+
+    parameters:
+    -----------
+    processor: KeywordProcessor
+        Ferdig bygget flashtext-prosessor der hvert navn er sitt eget nøkkelord
+    fingeravtrykk: str
+        Hash av navnelisten, unntakene og replacement
+    replacement: str
+        Teksten som erstatter hvert treff ved sladding
+    """
+
+    def __init__(
+        self, processor: KeywordProcessor, fingeravtrykk: str, replacement="PER"
+    ):
+        self.processor = processor
+        self.fingeravtrykk = fingeravtrykk
+        self.replacement = replacement
+
+    @classmethod
+    def fra_liste(cls, term_liste: list, unntak: list = [], replacement="PER"):
+        """
+        Bygg en navnematcher fra en liste med navn, uten ordene i unntak
+        """
+        unntak_sett = set(unntak)
+        # definerer en tom keywordprocessor
+        processor = KeywordProcessor(case_sensitive=False)
+        # flashtext sin keywordprocessor splitter ord på 'spesielle tegn' - ønsker her å behandle ord med følgende tegn som enkeltord
+        processor.non_word_boundaries.add("-")
+        processor.non_word_boundaries.add("æ")
+        processor.non_word_boundaries.add("ø")
+        processor.non_word_boundaries.add("å")
+        with uten_gc():
+            processor.add_keywords_from_list(
+                [n for n in set(term_liste) if n and n not in unntak_sett]
+            )
+        return cls(
+            processor, fingeravtrykk(term_liste, unntak, replacement), replacement
+        )
+
+    def finn(self, tekst: str):
+        """
+        Returner alle navn i teksten som (navn, start, slutt)
+        """
+        return self.processor.extract_keywords(tekst, span_info=True)
+
+    def sladd(self, tekst: str, treff: Counter = None):
+        """
+        Bytt ut alle navn i teksten med replacement
+
+        Dersom treff angis telles antall navn under replacement
+        """
+        navn = self.finn(tekst)
+        if not navn:
+            return tekst
+        if treff is not None:
+            treff[self.replacement] += len(navn)
+        deler = []
+        forrige = 0
+        for _, start, slutt in navn:
+            deler.append(tekst[forrige:start])
+            deler.append(self.replacement)
+            forrige = slutt
+        deler.append(tekst[forrige:])
+        return "".join(deler)
+
+    def lagre(self, filsti: Path):
+        """
+        Lagre trien til disk
+        """
+        filsti = Path(filsti)
+        filsti.parent.mkdir(parents=True, exist_ok=True)
+        tmp = filsti.with_suffix(".tmp")
+        with open(tmp, "wb") as f, uten_gc():
+            pickle.dump(
+                {
+                    "fingeravtrykk": self.fingeravtrykk,
+                    "replacement": self.replacement,
+                    "processor": self.processor,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        tmp.replace(filsti)
+
+    @classmethod
+    def last(cls, filsti: Path):
+        """
+        Last en navnematcher som er lagret med lagre
+        """
+        with open(filsti, "rb") as f, uten_gc():
+            d = pickle.load(f)
+        return cls(d["processor"], d["fingeravtrykk"], d["replacement"])
+
+
+# %%
+def hent_navnematcher(
+    term_liste: list,
+    unntak: list = None,
+    replacement="PER",
+    mappe: Path = cache_mappe,
+):
+    """
+    Hent navnematcheren for navnelisten
+
+    Gjenbruker matcheren dersom den allerede er bygget i denne prosessen,
+    ellers lastes den fra disk eller bygges og lagres til disk. Et nytt
+    kall med samme navneliste slås opp uten å regne ut fingeravtrykket.
+
+    parameters:
+    -----------
+    term_liste: list
+        Liste med navn som skal vaskes
+    unntak: list
+        Ord som ikke skal regnes som navn. Leses fra unntak.txt dersom dette ikke angis
+    replacement: str
+        Teksten som erstatter hvert treff
+    mappe: Path
+        Mappen der trien caches. Sett til None for å ikke bruke disk
+    """
+    rask_nøkkel = (
+        tuple(term_liste),
+        tuple(unntak) if unntak is not None else unntak_fil.stat().st_mtime_ns,
+        replacement,
+    )
+    if _nøkler.get(rask_nøkkel) in _matchere:
+        return _matchere[_nøkler[rask_nøkkel]]
+
+    if unntak is None:
+        unntak = les_unntak()
+    nøkkel = fingeravtrykk(term_liste, unntak, replacement)
+    _nøkler[rask_nøkkel] = nøkkel
+    if nøkkel in _matchere:
+        return _matchere[nøkkel]
+
+    filsti = Path(mappe) / f"navnetrie-{nøkkel}.pkl" if mappe else None
+    matcher = None
+    if filsti and filsti.exists():
+        try:
+            matcher = Navnematcher.last(filsti)
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError) as e:
+            logging.warning(f"Kunne ikke laste navnetrie fra {filsti}: {e}")
+    if matcher is None:
+        logging.info(f"Bygger navnetrie for {len(term_liste)} navn")
+        matcher = Navnematcher.fra_liste(term_liste, unntak, replacement)
+        if filsti:
+            matcher.lagre(filsti)
+
+    _matchere[nøkkel] = matcher
+    return matcher
@@ -0,0 +1,183 @@
+# %%
+import re
+
+from spacy.language import Language
+from spacy.tokens import Span
+
+# %%
+# deler et navn i omtrent de samme tokenene som spacy, brukes for navn med flere ord
+_tokenmønster = re.compile(r"\w+|[^\w\s]")
+# tegn spacy kan la stå inne i et token, f.eks. i Ola;Kari, #ola og www.ola.no.
+# Bindestrek og apostrof har egne regler i Navnesett.er_navn
+_skilletegn = re.compile(r"[^\w'-]+")
+
+# navnesett som allerede er bygget i denne prosessen, nøkkel er fingeravtrykket
+_navnesett = {}
+
+
+# %%
+class Navnesett:
+    """Navnene fra en navnematcher klare for oppslag på spacy-tokens
+
+    parameters:
+    -----------
+    navn: iterable
+        Navnene, sammenlignes med små bokstaver
+    label: str
+        Entitetstypen navnene merkes med
+    """
+
+    def __init__(self, navn, label="PER"):
+        self.navn = frozenset(n.lower() for n in navn if n)
+        self.label = label
+        flere = [_tokenmønster.findall(n) for n in self.navn if " " in n]
+        # første token i navn med flere ord, bare disse sjekkes for lengre treff
+        self.forledd = frozenset(deler[0] for deler in flere)
+        self.maks_tokens = max([len(deler) for deler in flere], default=1)
+
+    def er_navn(self, ord: str):
+        """
+        True om ordet er et navn, et navn med genitiv-apostrof eller bare navn
+        satt sammen med bindestrek
+
+        Tokens med andre skilletegn, f.eks. Ola;Kari eller www.ola.no, deles på
+        skilletegnene og regnes som navn dersom en av delene er et navn.
+        """
+        if ord in self.navn:
+            return True
+        if _skilletegn.search(ord):
+            return any(self._er_del_navn(d) for d in _skilletegn.split(ord) if d)
+        return self._er_del_navn(ord)
+
+    def _er_del_navn(self, ord: str):
+        if ord in self.navn:
+            return True
+        if "'" in ord and ord.split("'")[0] in self.navn:
+            return True
+        if "-" in ord:
+            deler = [d for d in ord.split("-") if d]
+            return bool(deler) and all(d in self.navn for d in deler)
+        return False
+
+    def lengde(self, doc, i: int):
+        """
+        Antall tokens i det lengste navnet som starter på token i, eller 0
+        """
+        token = doc[i].lower_
+        if token in self.forledd:
+            for lengde in range(min(self.maks_tokens, len(doc) - i), 1, -1):
+                if doc[i : i + lengde].text.lower() in self.navn:
+                    return lengde
+        return 1 if self.er_navn(token) else 0
+
+
+# %%
+def hent_navnesett(matcher):
+    """
+    Hent navnesettet for en navnematcher, bygges én gang per prosess
+    """
+    if matcher.fingeravtrykk not in _navnesett:
+        _navnesett[matcher.fingeravtrykk] = Navnesett(
+            matcher.processor.get_all_keywords(), matcher.replacement
+        )
+    return _navnesett[matcher.fingeravtrykk]
+
+
+# %%
+class Navneoppslag:
+    """Spacy-komponent som merker tokens fra navnelisten som personnavn
+
+    Slår opp hvert token i et frozenset med navn i samme gjennomgang som NER,
+    slik at teksten ikke må søkes gjennom på nytt med flashtext etterpå.
+    Ordgrensene blir de samme som i tokenizeren.
+
+    Navnesettet angis per kall med component_cfg i nlp.pipe, slik at samme
+    pipeline kan deles av tråder med forskjellige navnelister. Uten navnesett
+    gjør komponenten ingenting. Entiteter med typer i beholdes overskrives
+    ikke, andre entiteter som overlapper et navn fjernes.
+    """
+
+    def __call__(self, doc, navnesett: Navnesett = None, beholdes=None, **kwargs):
+        if navnesett is None:
+            return doc
+        beholdt = []
+        andre = []
+        for ent in doc.ents:
+            if beholdes is None or ent.label_ in beholdes:
+                beholdt.append(ent)
+            else:
+                andre.append(ent)
+        opptatt = set()
+        for ent in beholdt:
+            opptatt.update(range(ent.start, ent.end))
+
+        nye = []
+        i = 0
+        while i < len(doc):
+            lengde = navnesett.lengde(doc, i) if i not in opptatt else 0
+            if lengde and opptatt.isdisjoint(range(i, i + lengde)):
+                nye.append(Span(doc, i, i + lengde, label=navnesett.label))
+                i += lengde
+            else:
+                i += 1
+        if nye:
+            navnetokens = {i for span in nye for i in range(span.start, span.end)}
+            andre = [
+                ent
+                for ent in andre
+                if navnetokens.isdisjoint(range(ent.start, ent.end))
+            ]
+            doc.ents = sorted([*beholdt, *andre, *nye], key=lambda span: span.start)
+        return doc
+
+
+# %%
+@Language.factory("navneoppslag")
+def lag_navneoppslag(nlp: Language, name: str):
+    return Navneoppslag()
+
+
+# %%
+def sjekk_skilletegn():
+    """Sjekk at navn inne i tokens med skilletegn blir sladdet
+
+    Spacy deler ikke tokens som Ola;Kari, ola–kari, #ola eller www.ola.no.
+    Kaster AssertionError med tekstene der et navn står igjen.
+    """
+    import spacy
+
+    tokenizer = spacy.blank("nb").tokenizer
+    navnesett = Navnesett(["ola", "kari", "anne", "lise"])
+    oppslag = Navneoppslag()
+    tekster = {
+        "hei Ola;Kari her": "hei PER her",
+        "ola–kari": "PER",
+        "ola—kari": "PER",
+        "ola+kari": "PER",
+        "ola&kari": "PER",
+        "#ola": "PER",
+        "@kari": "PER",
+        "www.ola.no": "PER",
+        "anne-lise": "PER",
+        "Ola's bil": "PER bil",
+        "ola-bussen": "ola-bussen",
+        "kolakari": "kolakari",
+    }
+    avvik = {}
+    for tekst, forventet in tekster.items():
+        doc = oppslag(tokenizer(tekst), navnesett=navnesett)
+        deler = []
+        forrige = 0
+        for ent in doc.ents:
+            deler += [tekst[forrige : ent.start_char], ent.label_]
+            forrige = ent.end_char
+        vasket = "".join(deler) + tekst[forrige:]
+        if vasket != forventet:
+            avvik[tekst] = vasket
+    assert not avvik, f"Navn som ikke ble sladdet riktig: {avvik}"
+    return len(tekster)
+
+
+# %%
+if __name__ == "__main__":
+    print(f"{sjekk_skilletegn()} tekster med skilletegn ble sladdet riktig")
@@ -0,0 +1,167 @@
+# %%
+import json
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# %%
+ta_url = "https://api-admin.taskanalytics.com/api/v3"
+# (tilkobling, lesing) i sekunder
+standard_timeout = (10, 300)
+
+
+# %%
+def lag_sesjon(forsøk=3, backoff=1.0, tilkoblinger=10):
+    """Lag en requests-sesjon med gjenbruk av tilkoblinger og nye forsøk
+
+    Nye forsøk gjøres ved tilkoblingsfeil og ved svar med status 429 og 5xx,
+    med ventetid som dobles for hvert forsøk.
+
+    parameters:
+    -----------
+    forsøk: int
+        Maks antall nye forsøk per forespørsel
+    backoff: float
+        Ventetid i sekunder før andre forsøk, dobles for hvert forsøk etter det
+    tilkoblinger: int
+        Antall tilkoblinger som holdes åpne per vert
+    """
+    retry = Retry(
+        total=forsøk,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        # POST-kallene mot SSB og Task Analytics endrer ingenting og kan gjentas
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=tilkoblinger, pool_maxsize=tilkoblinger
+    )
+    sesjon = requests.Session()
+    sesjon.mount("http://", adapter)
+    sesjon.mount("https://", adapter)
+    return sesjon
+
+
+# %%
+def last_ned(
+    sesjon: requests.Session,
+    metode: str,
+    url: str,
+    filsti: Path,
+    timeout=standard_timeout,
+    **kwargs,
+):
+    """Last ned en respons rett til disk i biter
+
+    Skriver først til en midlertidig fil, slik at filsti aldri inneholder en
+    halvferdig nedlasting.
+
+    parameters:
+    -----------
+    sesjon: requests.Session
+        Sesjonen som brukes, se lag_sesjon
+    metode: str
+        "GET" eller "POST"
+    url: str
+        Adressen som lastes ned
+    filsti: Path
+        Filen responsen skrives til
+    timeout: tuple
+        Timeout i sekunder for tilkobling og lesing
+    kwargs:
+        Sendes videre til sesjon.request, f.eks. json eller headers
+    """
+    filsti = Path(filsti)
+    filsti.parent.mkdir(parents=True, exist_ok=True)
+    tmp = filsti.with_suffix(filsti.suffix + ".tmp")
+    with sesjon.request(metode, url, timeout=timeout, stream=True, **kwargs) as r:
+        r.raise_for_status()
+        with open(tmp, "wb") as f:
+            for bit in r.iter_content(chunk_size=1024 * 1024):
+                f.write(bit)
+    tmp.replace(filsti)
+    logging.info(f"Lastet ned {url} til {filsti}")
+    return filsti
+
+
+# %%
+def last_ned_survey(
+    sesjon: requests.Session,
+    username: str,
+    password: str,
+    survey_id: str,
+    filsti: Path,
+    url=ta_url,
+    timeout=standard_timeout,
+):
+    """Last ned svarene fra en Top Task-undersøkelse i Task Analytics som CSV
+
+    Samme kall som download_survey i taskanalytics-data-wrapper, men med
+    delt sesjon, timeout, nye forsøk og strømming til disk.
+
+    parameters:
+    -----------
+    sesjon: requests.Session
+        Sesjonen som brukes, se lag_sesjon
+    username: str
+        Brukernavn i Task Analytics
+    password: str
+        Passord i Task Analytics
+    survey_id: str
+        Id for undersøkelsen, f.eks. "03381"
+    filsti: Path
+        Filen svarene skrives til
+    url: str
+        Adressen til API-et, kan byttes ut med en lokal testserver
+    timeout: tuple
+        Timeout i sekunder for tilkobling og lesing
+    """
+    r = sesjon.post(
+        f"{url}/auth/login",
+        json={"grant_type": "password", "username": username, "password": password},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    token = r.json()["access_token"]
+    return last_ned(
+        sesjon,
+        "POST",
+        f"{url}/export/tm_{survey_id}",
+        filsti,
+        timeout=timeout,
+        headers={"Authorization": f"JWT {token}", "Accept": "text/csv"},
+    )
+
+
+# %%
+def last_ned_json(sesjon: requests.Session, url: str, filsti: Path, sporring: dict):
+    """
+    POST en spørring, lagre svaret til disk og returner det innleste JSON-objektet
+    """
+    filsti = last_ned(sesjon, "POST", url, filsti, json=sporring)
+    with open(filsti, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# %%
+def samtidig(oppgaver: dict, maks_tråder=None):
+    """Kjør flere nedlastinger samtidig i tråder
+
+    Returnerer {navn: resultat} når alle er ferdige. Dersom én feiler
+    kastes feilen etter at de andre er ferdige.
+
+    parameters:
+    -----------
+    oppgaver: dict
+        {navn: funksjon uten argumenter}
+    maks_tråder: int
+        Maks antall samtidige tråder. Dersom dette ikke angis brukes én per oppgave
+    """
+    with ThreadPoolExecutor(max_workers=maks_tråder or len(oppgaver) or 1) as pool:
+        futures = {navn: pool.submit(funksjon) for navn, funksjon in oppgaver.items()}
+        return {navn: future.result() for navn, future in futures.items()}
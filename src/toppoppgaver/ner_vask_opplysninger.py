@@ -1,31 +1,48 @@
 # %%
-import re
+import os
 import json
+import atexit
 import timeit
-from pathlib import Path
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import logging
+import threading
+from collections import Counter
 
-import spacy
 import numpy as np
-from flashtext import KeywordProcessor
+import pandas as pd
 
-logging.basicConfig(level=logging.INFO)
-
-# %%
+from navnematcher import hent_navnematcher
+from regexvasker import regex_patterns, siffer_patterns, hent_regexvasker
+from sladdecache import Sladdecache
+from profilering import Stegmaler
 
-patterns_folder = Path("../patterns/")
+logging.basicConfig(level=logging.INFO)
 
-regex_patterns_file = patterns_folder / "regex_patterns.txt"
-regex_patterns = json.loads(regex_patterns_file.read_text())
 # %%
-nlp = spacy.load(
-    "nb_core_news_lg",
-    exclude=["tok2vec", "morphologizer", "parser", "attribute_ruler", "lemmatizer"],
-)
+standard_modell = "nb_core_news_lg"
+# modellnivåene som kan velges i stedet for et modellnavn. regex betyr ingen
+# NER, bare regex og navnelisten
+modellnivåer = {
+    "sm": "nb_core_news_sm",
+    "md": "nb_core_news_md",
+    "lg": "nb_core_news_lg",
+    "regex": None,
+}
+standard_exclude = [
+    "tok2vec",
+    "morphologizer",
+    "parser",
+    "attribute_ruler",
+    "lemmatizer",
+]
 custom_patterns = [
     {"label": "FNR", "pattern": "[FNR]"},
     {"label": "TLF", "pattern": "[TLF]"},
     {"label": "EPOST", "pattern": "[EPOST]"},
+    {"label": "TALL", "pattern": "TALL"},
+    {"label": "ÅR", "pattern": "ÅR"},
     {"label": "finne", "pattern": [{"lower": "finne"}]},
     {"label": "andre", "pattern": [{"lower": "andre"}]},
 ]
@@ -35,8 +52,82 @@ ruler_config = {
     "overwrite_ents": True,
     "ent_id_sep": "||",
 }
-ruler = nlp.add_pipe("entity_ruler", config=ruler_config)
-ruler.add_patterns(custom_patterns)
+
+# entitetene som sladdes i regex-steget, entity ruler gjør taggene om til entiteter
+regex_entiteter = set(regex_patterns) | set(siffer_patterns)
+
+# ord entity ruler merker med seg selv, slik at NER ikke gjør dem til navn.
+# Teksten endres ikke, så de telles ikke som sladdede entiteter
+identitetsetiketter = {
+    p["label"] for p in custom_patterns if p["pattern"] == [{"lower": p["label"]}]
+}
+
+# lange tekster deles i biter på maks_tegn_per_del tegn med overlapp, og en
+# batch til spacy fylles opp til tegn_per_batch tegn
+maks_tegn_per_del = 1000
+overlapp_tegn = 100
+tegn_per_batch = 100_000
+
+# spacy-modeller som allerede er lastet i denne prosessen, nøkkel er (modell, exclude)
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+# pipelinene og tokenizeren er ikke trådsikre, tråder som deler dem kjører etter tur
+_modell_lock = threading.Lock()
+
+
+# %%
+def modell_for(modell):
+    """
+    Spacy-modellen for et modellnivå (sm, md, lg eller regex), eller modellnavnet
+    uendret. Returnerer None for regex og None
+    """
+    return modellnivåer.get(modell, modell)
+
+
+# %%
+def hent_nlp(modell=standard_modell, exclude=standard_exclude):
+    """Henter spacy-pipelinen med entity ruler for egne entiteter
+
+    Modellen lastes først når den trengs og deles av alle kall i prosessen,
+    slik at modellnivået regex aldri laster en spacy-modell. Til slutt i
+    pipelinen ligger navneoppslag, som merker navn fra SSB-listene når
+    navnesettet angis med component_cfg, se ner_vask_tekster.
+
+    parameters:
+    -----------
+    modell: str
+        Navnet på spacy-modellen som skal lastes, eller modellnivået sm, md eller lg
+    exclude: list
+        Komponenter i modellen som ikke skal lastes
+    """
+    modell = modell_for(modell)
+    if modell is None:
+        raise ValueError("Modellnivået regex har ingen spacy-modell")
+    nøkkel = (modell, tuple(exclude))
+    with _pipelines_lock:
+        if nøkkel not in _pipelines:
+            import spacy
+            import navneoppslag  # registrerer komponenten navneoppslag
+
+            logging.info(f"Laster spacy-modellen {modell}")
+            nlp = spacy.load(modell, exclude=list(exclude))
+            ruler = nlp.add_pipe("entity_ruler", config=ruler_config)
+            ruler.add_patterns(custom_patterns)
+            nlp.add_pipe("navneoppslag", last=True)
+            _pipelines[nøkkel] = nlp
+    return _pipelines[nøkkel]
+
+
+def hent_tokenizer():
+    """
+    Henter tokenizeren for norsk bokmål fra spacy, uten å laste en modell
+    """
+    with _pipelines_lock:
+        if "tokenizer" not in _pipelines:
+            import spacy
+
+            _pipelines["tokenizer"] = spacy.blank("nb").tokenizer
+    return _pipelines["tokenizer"]
 
 
 # %%
@@ -56,30 +147,13 @@ def flashtext_sladd(df, text_col_input, term_liste: list, text_col_output=None):
         Dersom dette ikke angis legges output i text_col_input-kolonnen.
 
     """
-    replacement = "PER"
-
-    # definerer en tom keywordprocessor
-    processor = KeywordProcessor(case_sensitive=False)
-    # flashtext sin keywordprocessor splitter ord på 'spesielle tegn' - ønsker her å behandle ord med følgende tegn som enkeltord
-    processor.non_word_boundaries.add("-")
-    processor.non_word_boundaries.add("æ")
-    processor.non_word_boundaries.add("ø")
-    processor.non_word_boundaries.add("å")
-
-    keyword_dict = {}
-    keyword_dict[replacement] = term_liste
-
-    processor.add_keywords_from_dict(keyword_dict)
+    matcher = hent_navnematcher(term_liste)
 
     # gjør en replace av alle søketermene med den grupperte versjonen av termen
     if text_col_output:
-        df[text_col_output] = (
-            df[text_col_input].astype(str).apply(processor.replace_keywords)
-        )
+        df[text_col_output] = df[text_col_input].astype(str).apply(matcher.sladd)
     else:
-        df[text_col_input] = (
-            df[text_col_input].astype(str).apply(processor.replace_keywords)
-        )
+        df[text_col_input] = df[text_col_input].astype(str).apply(matcher.sladd)
 
     return df
 
@@ -94,7 +168,8 @@ def regex_vask_df(df, entity, text_col_input, text_col_output=None):
         pandas dataframen som skal behandles
     entity:
         Hvilken entity som skal sladdes
-        (Definert av filen regex_patterns.txt (FNR, TLF eller EPOST))
+        (Definert av filen regex_patterns.txt (FNR, TLF eller EPOST)
+        eller siffer_patterns (TALL eller ÅR))
     text_col_input: str
         Navnet på kolonnen i dataframen med teksten som skal behandles
     text_col_output: str
@@ -103,23 +178,212 @@ def regex_vask_df(df, entity, text_col_input, text_col_output=None):
 
     """
 
-    regex_pattern = regex_patterns[entity]["pattern"]
-    regex_pat = re.compile(regex_pattern, flags=re.IGNORECASE)
-    tag = regex_patterns[entity]["tag"]
+    vasker = hent_regexvasker((entity,))
 
     if text_col_output:
         out_col = text_col_output
     else:
         out_col = text_col_input
 
-    df[out_col] = df[text_col_input].replace(regex_pat, tag, regex=True)
+    df[out_col] = df[text_col_input].map(
+        lambda x: vasker.vask(x) if isinstance(x, str) else x
+    )
 
     return df
 
 
+# %%
+def doc_spenn(doc, ents_list):
+    """
+    Returner (start, slutt, label) for entitetene i et spacy-doc som skal sladdes
+    """
+    return [
+        (ent.start_char, ent.end_char, ent.label_)
+        for ent in doc.ents
+        if ent.label_ in ents_list
+    ]
+
+
+# %%
+def sladd_spenn(tekst: str, spenn: list):
+    """Bygger vasket tekst fra entitetsspennene med én join
+
+    parameters:
+    -----------
+    tekst: str
+        Teksten som skal vaskes
+    spenn: list
+        Sorterte, ikke-overlappende (start, slutt, label) som byttes ut med label
+    """
+    if not spenn:
+        return tekst
+    deler = []
+    forrige = 0
+    for start, slutt, label in spenn:
+        deler.append(tekst[forrige:start])
+        deler.append(label)
+        forrige = slutt
+    deler.append(tekst[forrige:])
+    return "".join(deler)
+
+
+# %%
+def del_tekst(tekst: str, maks_tegn=maks_tegn_per_del, overlapp=overlapp_tegn):
+    """Deler en lang tekst i biter med litt overlapp
+
+    Bitene kuttes helst etter slutten av en setning, ellers ved mellomrom.
+    Returnerer en liste med (startposisjon, bit).
+
+    parameters:
+    -----------
+    tekst: str
+        Teksten som skal deles
+    maks_tegn: int
+        Maks antall tegn per bit
+    overlapp: int
+        Omtrent hvor mange tegn som tas med fra forrige bit
+    """
+    if len(tekst) <= maks_tegn:
+        return [(0, tekst)]
+    deler = []
+    start = 0
+    while start < len(tekst):
+        slutt = min(start + maks_tegn, len(tekst))
+        if slutt < len(tekst):
+            vindu = tekst[start + overlapp + 1 : slutt]
+            kutt = max(vindu.rfind(tegn) for tegn in (". ", "! ", "? ", "\n"))
+            if kutt < 0:
+                kutt = max(vindu.rfind(" "), vindu.rfind("\t"))
+            if kutt >= 0:
+                slutt = start + overlapp + 1 + kutt + 1
+        deler.append((start, tekst[start:slutt]))
+        if slutt >= len(tekst):
+            break
+        # neste bit starter ved et mellomrom rett før overlappen
+        neste = tekst.rfind(" ", start + 1, slutt - overlapp)
+        start = neste + 1 if neste >= 0 else slutt - overlapp
+    return deler
+
+
+# %%
+def tegnbatcher(deler: list, tegn_per_batch=tegn_per_batch, batch_size=None):
+    """
+    Samler tekster i batcher på omtrent tegn_per_batch tegn, og maks batch_size tekster
+    """
+    batch = []
+    tegn = 0
+    for del_ in deler:
+        if batch and (
+            tegn + len(del_) > tegn_per_batch
+            or (batch_size is not None and len(batch) >= batch_size)
+        ):
+            yield batch
+            batch = []
+            tegn = 0
+        batch.append(del_)
+        tegn += len(del_)
+    if batch:
+        yield batch
+
+
+# %%
+def ner_spenn(
+    tekster: list,
+    nlp,
+    ents_list,
+    batch_size=None,
+    n_process=1,
+    maks_tegn=maks_tegn_per_del,
+    overlapp=overlapp_tegn,
+    print_progress=False,
+    component_cfg=None,
+):
+    """Finner entitetsspennene i hver tekst med NER
+
+    Lange tekster deles med del_tekst og spennene flyttes tilbake til
+    posisjonene i den opprinnelige teksten. Med én prosess dannes batcher
+    etter antall tegn, se tegnbatcher. Med flere prosesser sendes alle
+    bitene i ett kall til nlp.pipe, slik at spacy bare starter prosessene én
+    gang, og batchene begrenses bare av batch_size.
+
+    parameters:
+    -----------
+    tekster: list
+        Tekstene som skal analyseres
+    nlp: spacy.Language
+        Spacy-pipelinen, se hent_nlp
+    ents_list: list
+        Hvilke enititetstyper som skal hensyntas
+    batch_size: int
+        Maks antall tekster per batch. Dersom dette ikke angis begrenses batchene bare av antall tegn
+    n_process: int
+        Antall parallelle prosesser i nlp.pipe
+    maks_tegn: int
+        Maks antall tegn som sendes til spacy per tekst, se del_tekst
+    overlapp: int
+        Antall tegn med overlapp mellom bitene av en lang tekst
+    print_progress: bool
+        True om funksjonen skal printe hvor langt den har kommet underveis
+    component_cfg: dict
+        Argumenter til komponentene i pipelinen, sendes videre til nlp.pipe
+    """
+    eier = []
+    forskyvning = []
+    deler = []
+    for ind, tekst in enumerate(tekster):
+        for start, del_ in del_tekst(tekst, maks_tegn, overlapp):
+            eier.append(ind)
+            forskyvning.append(start)
+            deler.append(del_)
+
+    if n_process == 1:
+        docs = (
+            doc
+            for batch in tegnbatcher(deler, batch_size=batch_size)
+            for doc in nlp.pipe(
+                batch, batch_size=len(batch), component_cfg=component_cfg
+            )
+        )
+    else:
+        docs = nlp.pipe(
+            deler,
+            batch_size=batch_size,
+            n_process=n_process,
+            component_cfg=component_cfg,
+        )
+
+    funnet = [[] for _ in tekster]
+    for ferdig, doc in enumerate(docs, start=1):
+        ind = eier[ferdig - 1]
+        funnet[ind].extend(
+            (start + forskyvning[ferdig - 1], slutt + forskyvning[ferdig - 1], label)
+            for start, slutt, label in doc_spenn(doc, ents_list)
+        )
+        if print_progress == True and (ferdig % 1000 == 0 or ferdig == len(deler)):
+            logging.info(f"NER ferdig for {ferdig} av {len(deler)} tekstbiter")
+
+    spenn = []
+    for treff in funnet:
+        # entiteter i overlappen kan være funnet to ganger, eller være kuttet
+        # i den ene biten. Beholder det lengste spennet som starter først
+        treff.sort(key=lambda t: (t[0], t[0] - t[1]))
+        ikke_overlappende = []
+        for t in treff:
+            if not ikke_overlappende or t[0] >= ikke_overlappende[-1][1]:
+                ikke_overlappende.append(t)
+        spenn.append(ikke_overlappende)
+    return spenn
+
+
 # %%
 def spacy_vask(
-    df, text_col_input, text_col_output, ents_list, n_process, print_progress
+    df,
+    text_col_input,
+    text_col_output,
+    ents_list,
+    n_process,
+    print_progress,
+    modell=standard_modell,
 ):
     """Sladder bort personopplysninger fra tekst vha. NER.
 
@@ -146,8 +410,11 @@ def spacy_vask(
         Antall parallelle prosesser i spacy-prosesseringen
     print_progress: bool
         True om funksjonen skal printe hvor langt den har kommet underveis
+    modell: str
+        Navnet på spacy-modellen som skal brukes
 
     """
+    nlp = hent_nlp(modell)
 
     # velger å la tomme tekst-celler få en tom string
     df["temp_text_col"] = df[text_col_input].fillna("")
@@ -157,20 +424,12 @@ def spacy_vask(
     else:
         out_col = text_col_input
 
-    df[out_col] = np.empty((len(df), 0)).tolist()
-
-    for ind, doc in enumerate(nlp.pipe(df["temp_text_col"], n_process=n_process)):
-        if ind % 5000 == 0 and print_progress == True:
-            logging.info(f"Nå på tekst nr: {ind} - {min(ind + 5000-1, len(df))}")
-        clean_text = df["temp_text_col"].loc[ind]
-        for ent in reversed(doc.ents):
-            if ent.label_ in ents_list:
-                clean_text = (
-                    clean_text[: ent.start_char]
-                    + ent.label_
-                    + clean_text[ent.end_char :]
-                )
-        df.at[ind, out_col] = clean_text
+    tekster = df["temp_text_col"].tolist()
+    spenn = ner_spenn(
+        tekster, nlp, ents_list, n_process=n_process, print_progress=print_progress
+    )
+    vasket = [sladd_spenn(tekst, s) for tekst, s in zip(tekster, spenn)]
+    df[out_col] = vasket
 
     df = df.drop(columns=["temp_text_col"])
 
@@ -187,13 +446,16 @@ def sladd_tekster(
     n_process=1,
     print_progress=True,
     text_col_output=None,
+    modell=standard_modell,
 ):
     """Sladding av entiteter i fritekst.
 
     Utfører følgende steg:
     1. regelbasert sladding (regex)
-    2. NER-sladding (spacy)
-    3. listebasert sladding (navn fra SSB)
+    2. NER-sladding (spacy), der navn fra SSB merkes på tokenene i samme
+       gjennomgang av komponenten navneoppslag
+
+    Se sladd_dataframe for å vaske flere kolonner i én omgang.
 
     parameters:
     -----------
@@ -206,11 +468,14 @@ def sladd_tekster(
             "FNR" - fødselsnummer/d-nummer (regex)
             "TLF" - telefonnummer (regex)
             "EPOST" - epostadresser (regex)
+            "TALL" - tall med fem eller flere siffer (regex)
+            "ÅR" - tall med fire siffer (regex)
             "PER" - personnavn (spacy + SSB-liste)
             "LOC" - stedsnavn (spacy)
             "ORG" - organisasjoner/bedriftsnavn (spacy)
     term_liste: list
-        Liste med begreper som skal vaskes. Videresendes til flashtext_sladd.
+        Navnene fra SSB som skal vaskes. Bygges til et Navnesett som
+        navneoppslag slår opp hvert token i, se navneoppslag.py
     ekstra_vask_av_navn: bool
         True om funksjonen skal kjøre SSB-navnevask i tillegg til NER
     n_process: int
@@ -220,11 +485,163 @@ def sladd_tekster(
     text_col_output: str
         Eventuelt navn på kolonne for vasket tekst.
         Dersom dette ikke angis legges output i text_col_input-kolonnen.
+    modell: str
+        Navnet på spacy-modellen som skal brukes
     """
-    start = timeit.default_timer()
+    # re-indekserer dataframen for å være sikker på at hver indeksverdi er unik
+    df = df.reset_index(drop=True)
+
+    if text_col_output:
+        df[text_col_output] = df[text_col_input]
+        out_col = text_col_output
+    else:
+        out_col = text_col_input
+
+    return sladd_dataframe(
+        df,
+        columns=[out_col],
+        term_liste=term_liste,
+        ents_list=ents_list,
+        ekstra_vask_av_navn=ekstra_vask_av_navn,
+        n_process=n_process,
+        print_progress=print_progress,
+        modell=modell,
+    )
+
+
+# %%
+# regler for tekster som ikke kan inneholde entiteter fra NER-modellen
+forfilter_regler = {
+    # teksten har ingen bokstaver, f.eks. bare tegnsetting eller mellomrom
+    "uten_bokstaver": True,
+    # teksten har ingen store bokstaver, siffer eller @
+    "uten_stor_bokstav": True,
+}
+
+
+# %%
+def trenger_ner(tekst: str, regler=forfilter_regler):
+    """Avgjør om en tekst må sendes gjennom NER-modellen
+
+    Tekster med tagger fra regex-vaskingen sendes alltid gjennom, slik at
+    entity ruler gjør dem om til entiteter.
+    Det samme gjør enkeltord med stor bokstav, som kan være navn som
+    mangler i SSB-listene.
+
+    parameters:
+    -----------
+    tekst: str
+        Teksten etter regex-vasking
+    regler: dict
+        Hvilke regler i forfilter_regler som skal brukes
+    """
+    if any(p["tag"] in tekst for p in regex_patterns.values()):
+        return True
+    if regler.get("uten_bokstaver") and not any(c.isalpha() for c in tekst):
+        return False
+    if regler.get("uten_stor_bokstav") and not any(
+        c.isupper() or c.isdigit() or c == "@" for c in tekst
+    ):
+        return False
+    return True
+
+
+# %%
+def vask_fingeravtrykk(ents_list, modell=standard_modell, matcher=None, forfilter=None):
+    """
+    Lag en hash av modellen, mønstrene og navnelisten som brukes i vaskingen
+    """
+    h = hashlib.sha256()
+    h.update(
+        json.dumps(
+            [
+                sorted(ents_list),
+                modell_for(modell),
+                standard_exclude,
+                custom_patterns,
+                regex_patterns,
+                siffer_patterns,
+                matcher.fingeravtrykk if matcher is not None else None,
+                forfilter,
+                # navn fra listen merkes på spacy-tokens, også i tekstene som
+                # ikke går gjennom NER og inne i tokens med skilletegn, se
+                # navneoppslag og navnevask_tekster
+                "navneoppslag-skilletegn" if matcher is not None else None,
+                # uten spacy-modell får taggene ikke klammer, se sladd_liste
+                "uten klammer" if modell_for(modell) is None else None,
+                # etikettene som ikke telles som treff
+                sorted(identitetsetiketter),
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+        ).encode("utf-8")
+    )
+    return h.hexdigest()[:16]
+
+
+# %%
+def sladd_liste(
+    tekster: list,
+    term_liste: list,
+    ents_list=["PER", "FNR", "TLF", "LOC", "ORG", "EPOST"],
+    ekstra_vask_av_navn=True,
+    n_process=1,
+    batch_size=256,
+    chunk_size=1000,
+    print_progress=True,
+    modell=standard_modell,
+    cache=None,
+    maler=None,
+    forfilter=forfilter_regler,
+    treff: list = None,
+    matcher=None,
+):
+    """Sladding av entiteter i en liste med tekster.
+
+    Like tekster vaskes bare én gang, og tekster som finnes i cachen hoppes
+    over før regex, NER og navnevask.
+
+    parameters:
+    -----------
+    tekster: list
+        Tekstene som skal vaskes
+    cache: Sladdecache
+        Cache med tekster som er vasket tidligere. Dersom dette ikke angis
+        brukes en cache i minnet for denne kjøringen.
+    maler: Stegmaler
+        Eventuell måler for tid og minne i regex-, NER- og navnesteget
+    forfilter: dict
+        Regler for tekster som sendes forbi NER, se trenger_ner. None sender alle
+        tekstene gjennom NER. Regex kjøres uansett på alle tekstene, og tekstene
+        som ikke går gjennom NER navnevaskes med navnevask_tekster.
+    treff: list
+        Dersom en liste angis, legges det til én dictionary {entitet: antall}
+        per tekst med treffene stegene fant mens teksten ble vasket
+    matcher: Navnematcher
+        Navnematcher som allerede er hentet, brukes i stedet for å slå opp
+        navnematcheren for term_liste ved hvert kall
+
+    Se sladd_dataframe for de andre parameterne.
+    """
+    if ekstra_vask_av_navn != True:
+        matcher = None
+    elif matcher is None:
+        matcher = hent_navnematcher(term_liste)
+    if cache is None:
+        cache = Sladdecache(vask_fingeravtrykk(ents_list, modell, matcher, forfilter))
+    if maler is None:
+        maler = Stegmaler(logg=False)
+
+    # like tekster og tekster fra cachen sendes ikke gjennom vaskingen
+    alle = tekster
+    ferdig = cache.hent_mange(list(dict.fromkeys(alle)))
+    nye = [tekst for tekst in dict.fromkeys(alle) if tekst not in ferdig]
+    tekster = nye
 
     if print_progress == True:
-        logging.info(f"**Tokenisering og vasking for {len(df)} tekster**")
+        logging.info(
+            f"{len(ferdig) + len(nye)} unike av {len(alle)} tekster, {len(ferdig)} hentet fra cache"
+        )
         logging.info("Starter vasking av følgende entiteter")
         logging.info(
             [
@@ -233,47 +650,503 @@ def sladd_tekster(
                 if ent in ["PER", "FNR", "TLF", "LOC", "ORG", "EPOST"]
             ]
         )
+    if not nye:
+        return _fra_cache(alle, ferdig, treff)
 
-    # re-indekserer dataframen for å være sikker på at hver indeksverdi er unik
-    df = df.reset_index(drop=True)
-
-    df["temp_text_col"] = df[text_col_input]
-    if text_col_output:
-        out_col = text_col_output
-    else:
-        out_col = text_col_input
-
-    # entitetstyper som håndteres med regex først:
-    if "FNR" in ents_list:
+    # entitetstyper som håndteres med regex først, i fast rekkefølge, se Regexvasker:
+    regex_ents = tuple(e for e in ents_list if e in regex_entiteter)
+    tellere = [Counter() for _ in tekster]
+    if regex_ents:
         if print_progress == True:
-            logging.info(f"Kjører regex for FNR...")
-        df = regex_vask_df(df, entity="FNR", text_col_input="temp_text_col")
-    if "TLF" in ents_list:
+            logging.info(f"Kjører regex for {', '.join(regex_ents)}...")
+        with maler.steg("regex", antall=len(tekster)):
+            # uten spacy-modell går ingen tekster gjennom entity ruler, som
+            # ellers gjør taggene med klammer om til entiteter
+            vasker = hent_regexvasker(
+                regex_ents, klammer=modell_for(modell) is not None
+            )
+            tekster = [vasker.vask(t, teller) for t, teller in zip(tekster, tellere)]
         if print_progress == True:
-            logging.info(f"Kjører regex for TLF...")
-        df = regex_vask_df(df, entity="TLF", text_col_input="temp_text_col")
-    if "EPOST" in ents_list:
+            logging.info(f"Treff på regex: {dict(sum(tellere, Counter()))}")
+
+    # tekster som ikke kan inneholde entiteter fra modellen sendes forbi NER
+    til_ner = list(range(len(tekster)))
+    if modell_for(modell) is None:
+        # modellnivået regex bruker bare regex og navnelisten
+        til_ner = []
+    elif forfilter:
+        with maler.steg("forfilter", antall=len(tekster)) as s:
+            til_ner = [
+                i for i, tekst in enumerate(tekster) if trenger_ner(tekst, forfilter)
+            ]
+            s["hoppet_over"] = len(tekster) - len(til_ner)
         if print_progress == True:
-            logging.info("Kjører regex for EPOST...")
-        df = regex_vask_df(df, entity="EPOST", text_col_input="temp_text_col")
+            logging.info(
+                f"{len(tekster) - len(til_ner)} av {len(tekster)} tekster trenger ikke NER"
+            )
+    ner_tekster = [tekster[i] for i in til_ner]
+    ner_tellere = [tellere[i] for i in til_ner]
 
-    # entitetstyper som håndteres med spacy NER-modell:
+    # entitetstyper som håndteres med spacy NER-modell, deretter SSB-navnelister:
     if print_progress == True:
         logging.info("Starter NER...")
-    df = spacy_vask(df, "temp_text_col", out_col, ents_list, n_process, print_progress)
+        if matcher is not None:
+            logging.info("Merker også personnavn fra SSB-lister i NER")
+    vasket = list(tekster)
+    if matcher is not None:
+        # navn i tekstene som går gjennom NER merkes av navneoppslag i spacy,
+        # de andre tekstene får navnene merket på tokens uten NER
+        uten_ner = sorted(set(range(len(vasket))) - set(til_ner))
+        if uten_ner:
+            with maler.steg("navnevask", antall=len(uten_ner)):
+                navnevasket = navnevask_tekster(
+                    [vasket[i] for i in uten_ner],
+                    matcher,
+                    batch_size=batch_size,
+                    treff=[tellere[i] for i in uten_ner],
+                )
+            for i, tekst in zip(uten_ner, navnevasket):
+                vasket[i] = tekst
+    if n_process == 1:
+        if ner_tekster:
+            with maler.steg("NER", antall=len(ner_tekster)):
+                ner_vasket = ner_vask_tekster(
+                    ner_tekster,
+                    hent_nlp(modell),
+                    ents_list,
+                    matcher=matcher,
+                    batch_size=batch_size,
+                    print_progress=print_progress,
+                    treff=ner_tellere,
+                )
+            for i, tekst in zip(til_ner, ner_vasket):
+                vasket[i] = tekst
+    else:
+        if ner_tekster:
+            # NER og navnevask kjøres sammen i hver arbeidsprosess
+            with maler.steg("NER og navnevask", antall=len(ner_tekster)):
+                ner_vasket = sladd_parallelt(
+                    ner_tekster,
+                    ents_list,
+                    matcher=matcher,
+                    modell=modell,
+                    n_process=n_process,
+                    chunk_size=chunk_size,
+                    batch_size=batch_size,
+                    print_progress=print_progress,
+                    treff=ner_tellere,
+                )
+            for i, tekst in zip(til_ner, ner_vasket):
+                vasket[i] = tekst
 
-    if ekstra_vask_av_navn == True:
-        if print_progress == True:
-            logging.info("Starter ekstra vask av personnavn mot SSB-lister...")
-        df = flashtext_sladd(df=df, text_col_input=out_col, term_liste=term_liste)
+    vaskede = {
+        tekst: (v, dict(teller)) for tekst, v, teller in zip(nye, vasket, tellere)
+    }
+    cache.lagre_mange(vaskede)
+    ferdig.update(vaskede)
+    return _fra_cache(alle, ferdig, treff)
+
+
+def _fra_cache(alle: list, ferdig: dict, treff: list = None):
+    """
+    Slå opp vasket tekst for alle tekstene, og eventuelt treffene i listen treff
+    """
+    if treff is not None:
+        treff.extend(ferdig[tekst][1] for tekst in alle)
+    return [ferdig[tekst][0] for tekst in alle]
+
+
+# %%
+def sladd_dataframe(
+    df,
+    columns: list,
+    term_liste: list,
+    ents_list=["PER", "FNR", "TLF", "LOC", "ORG", "EPOST"],
+    ekstra_vask_av_navn=True,
+    n_process=1,
+    batch_size=256,
+    chunk_size=1000,
+    print_progress=True,
+    modell=standard_modell,
+    cache=None,
+    maler=None,
+    forfilter=forfilter_regler,
+    med_treff=False,
+):
+    """Sladding av entiteter i flere fritekstkolonner i én omgang.
+
+    Samler alle ikke-tomme celler fra kolonnene i én strøm, kjører regex,
+    NER og navnevask over strømmen én gang og skriver vasket tekst tilbake
+    til riktig rad og kolonne. Tomme celler sendes ikke gjennom spacy.
+
+    parameters:
+    -----------
+    df: pd.dataframe
+        pandas dataframen som skal behandles
+    columns: list
+        Kolonnene med fritekst som skal vaskes
+    term_liste: list
+        Navnene fra SSB som skal vaskes. Bygges til et Navnesett som
+        navneoppslag slår opp hvert token i, se sladd_liste
+    ents_list: list
+        Hvilke enititetstyper som skal hensyntas, se sladd_tekster
+    ekstra_vask_av_navn: bool
+        True om funksjonen skal kjøre SSB-navnevask i tillegg til NER
+    n_process: int
+        Antall parallelle prosesser i NER og navnevask, se sladd_parallelt
+    batch_size: int
+        Antall tekster per batch i spacy-prosesseringen
+    chunk_size: int
+        Antall tekster som sendes til en arbeidsprosess om gangen
+    print_progress: bool
+        True om funksjonen skal printe hvor langt den har kommet underveis
+    modell: str
+        Navnet på spacy-modellen som skal brukes, eller modellnivået sm, md,
+        lg eller regex. Med regex kjøres ingen NER, bare regex og navnevask
+    cache: Sladdecache
+        Eventuell cache med tekster som er vasket tidligere, se sladd_liste
+    maler: Stegmaler
+        Eventuell måler for tid og minne per steg, se sladd_liste
+    forfilter: dict
+        Regler for tekster som sendes forbi NER, se trenger_ner
+    med_treff: bool
+        True om funksjonen også skal returnere treffene per celle, se treffmatrise
+
+    Returns
+    -------
+    df: pd.DataFrame med vasket tekst
+    treff: pd.DataFrame med én rad per ikke-tom celle dersom med_treff er True
+    """
+    start = timeit.default_timer()
+    df = df.copy()
+
+    # samler ikke-tomme celler fra alle kolonnene i én flat liste
+    posisjoner = {}
+    tekster = []
+    for kolonne in columns:
+        verdier = df[kolonne]
+        ikke_tomme = verdier.notna() & (verdier.astype(str).str.strip() != "")
+        posisjoner[kolonne] = np.flatnonzero(ikke_tomme.to_numpy())
+        tekster.extend(verdier[ikke_tomme].astype(str).tolist())
+
+    if print_progress == True:
+        logging.info(
+            f"**Tokenisering og vasking for {len(tekster)} tekster i {len(columns)} kolonner**"
+        )
+    treff_liste = [] if med_treff else None
+    vasket = sladd_liste(
+        tekster,
+        term_liste=term_liste,
+        ents_list=ents_list,
+        ekstra_vask_av_navn=ekstra_vask_av_navn,
+        n_process=n_process,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+        print_progress=print_progress,
+        modell=modell,
+        cache=cache,
+        maler=maler,
+        forfilter=forfilter,
+        treff=treff_liste,
+    )
+
+    # skriver vasket tekst tilbake til riktig rad og kolonne
+    neste = 0
+    for kolonne in columns:
+        pos = posisjoner[kolonne]
+        verdier = df[kolonne].to_numpy(dtype=object, copy=True)
+        verdier[pos] = vasket[neste : neste + len(pos)]
+        df[kolonne] = verdier
+        neste += len(pos)
 
     stop = timeit.default_timer()
     if print_progress == True:
-        logging.info(f"  {len(df)} tekster vasket på {'%.3f'%(stop - start)} sek")
+        logging.info(f"  {len(tekster)} tekster vasket på {'%.3f'%(stop - start)} sek")
 
+    if med_treff:
+        indeks = np.concatenate(
+            [df.index.to_numpy()[posisjoner[k]] for k in columns]
+            or [np.array([], dtype=df.index.dtype)]
+        )
+        kolonner = pd.Categorical(
+            np.repeat(columns, [len(posisjoner[k]) for k in columns]),
+            categories=columns,
+        )
+        ents = treff_kolonner(ents_list, ekstra_vask_av_navn)
+        treff = treffmatrise(treff_liste, ents)
+        return df, pd.DataFrame(
+            {"kolonne": kolonner, **dict(zip(ents, treff.T))}, index=indeks
+        )
     return df
 
 
+# %%
+def treff_kolonner(ents_list: list, ekstra_vask_av_navn=True):
+    """
+    Entitetene det telles treff for, PER er alltid med når navnevask er på
+
+    Etikettene i identitetsetiketter er ikke personopplysninger og blir ikke med.
+    """
+    ents = [e for e in ents_list if e not in identitetsetiketter]
+    if ekstra_vask_av_navn:
+        return list(dict.fromkeys([*ents, "PER"]))
+    return ents
+
+
+# %%
+def treffmatrise(treff: list, ents_list: list):
+    """Gjør om treffene per tekst til en heltallsmatrise
+
+    parameters:
+    -----------
+    treff: list
+        {entitet: antall} per tekst, se sladd_liste
+    ents_list: list
+        Entitetene som blir kolonner i matrisen, i samme rekkefølge
+    """
+    kolonne = {ent: i for i, ent in enumerate(ents_list)}
+    matrise = np.zeros((len(treff), len(ents_list)), dtype=np.int32)
+    for rad, teller in enumerate(treff):
+        for ent, antall in teller.items():
+            if ent in kolonne:
+                matrise[rad, kolonne[ent]] = antall
+    return matrise
+
+
+# %%
+def ner_vask_tekster(
+    tekster: list,
+    nlp,
+    ents_list,
+    matcher=None,
+    batch_size=256,
+    print_progress=False,
+    treff: list = None,
+):
+    """Sladder entiteter med NER og eventuelt navn fra SSB i denne prosessen
+
+    parameters:
+    -----------
+    tekster: list
+        Tekstene som skal vaskes
+    nlp: spacy.Language
+        Spacy-pipelinen, se hent_nlp
+    ents_list: list
+        Hvilke enititetstyper som skal hensyntas
+    matcher: Navnematcher
+        Navnematcher for ekstra vask av personnavn. Navnene merkes på tokenene
+        av navneoppslag i samme gjennomgang som NER. Hoppes over dersom None
+    batch_size: int
+        Maks antall tekster per batch i spacy-prosesseringen. Batchene
+        begrenses også av tegn_per_batch
+    print_progress: bool
+        True om funksjonen skal printe hvor langt den har kommet underveis
+    treff: list
+        Eventuelt én Counter per tekst der treff per entitet telles. Entitetene
+        entity ruler finner fra regex-taggene er talt i regex-steget og telles
+        ikke, og heller ikke etikettene i identitetsetiketter
+    """
+    component_cfg = None
+    if matcher is not None:
+        from navneoppslag import hent_navnesett
+
+        component_cfg = {
+            "navneoppslag": {
+                "navnesett": hent_navnesett(matcher),
+                "beholdes": set(ents_list),
+            }
+        }
+        ents_list = list(dict.fromkeys([*ents_list, matcher.replacement]))
+    with _modell_lock:
+        spenn = ner_spenn(
+            tekster,
+            nlp,
+            ents_list,
+            batch_size=batch_size,
+            print_progress=print_progress,
+            component_cfg=component_cfg,
+        )
+    vasket = [sladd_spenn(tekst, s) for tekst, s in zip(tekster, spenn)]
+    if treff is not None:
+        for teller, s in zip(treff, spenn):
+            teller.update(
+                label
+                for _, _, label in s
+                if label not in regex_entiteter and label not in identitetsetiketter
+            )
+    return vasket
+
+
+# %%
+def navnevask_tekster(tekster: list, matcher, batch_size=256, treff: list = None):
+    """Sladder navn fra SSB-listene i tekster som ikke går gjennom NER
+
+    Tekstene deles bare i tokens, og navnene merkes med det samme
+    navneoppslaget som i NER-pipelinen, slik at ordgrensene blir de samme
+    uansett om teksten går gjennom NER eller ikke.
+
+    parameters:
+    -----------
+    tekster: list
+        Tekstene som skal vaskes
+    matcher: Navnematcher
+        Navnematcheren med navnene som skal sladdes
+    batch_size: int
+        Antall tekster per batch i tokenizeren
+    treff: list
+        Eventuelt én Counter per tekst der antall navn telles
+    """
+    from navneoppslag import Navneoppslag, hent_navnesett
+
+    navnesett = hent_navnesett(matcher)
+    oppslag = Navneoppslag()
+    with _modell_lock:
+        alle_spenn = [
+            [
+                (ent.start_char, ent.end_char, ent.label_)
+                for ent in oppslag(doc, navnesett=navnesett).ents
+            ]
+            for doc in hent_tokenizer().pipe(tekster, batch_size=batch_size)
+        ]
+    vasket = []
+    for ind, (tekst, spenn) in enumerate(zip(tekster, alle_spenn)):
+        vasket.append(sladd_spenn(tekst, spenn))
+        if treff is not None:
+            treff[ind].update(label for _, _, label in spenn)
+    return vasket
+
+
+# %%
+# tilstand i hver arbeidsprosess ved parallell NER, settes av _start_arbeider
+_arbeider = {}
+
+# prosesspoolen for parallell NER gjenbrukes mellom kall med samme oppsett,
+# slik at modellen og navnene bare lastes én gang per arbeidsprosess
+_pool = {"nøkkel": None, "executor": None}
+_pool_lock = threading.Lock()
+
+
+def _start_arbeider(modell, ents_list, matcher, batch_size):
+    """
+    Laster spacy-modellen og navnematcheren én gang per arbeidsprosess
+    """
+    _arbeider["nlp"] = hent_nlp(modell)
+    _arbeider["ents_list"] = ents_list
+    _arbeider["matcher"] = matcher
+    _arbeider["batch_size"] = batch_size
+
+
+def _vask_bit(tekster):
+    treff = [Counter() for _ in tekster]
+    return ner_vask_tekster(tekster, treff=treff, **_arbeider), treff
+
+
+# %%
+def hent_pool(n_process, start_method, modell, ents_list, matcher, batch_size):
+    """Hent prosesspoolen for parallell NER, eller start en ny
+
+    Poolen beholdes til et kall trenger et annet oppsett, eller til
+    lukk_pool kalles eller prosessen avsluttes.
+    """
+    nøkkel = (
+        n_process,
+        start_method,
+        modell,
+        tuple(ents_list),
+        matcher.fingeravtrykk if matcher is not None else None,
+        batch_size,
+    )
+    with _pool_lock:
+        if _pool["nøkkel"] != nøkkel:
+            if _pool["executor"] is not None:
+                _pool["executor"].shutdown()
+            _pool["executor"] = ProcessPoolExecutor(
+                max_workers=n_process,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=_start_arbeider,
+                initargs=(modell, ents_list, matcher, batch_size),
+            )
+            _pool["nøkkel"] = nøkkel
+        return _pool["executor"]
+
+
+@atexit.register
+def lukk_pool():
+    """
+    Stopp arbeidsprosessene for parallell NER
+    """
+    with _pool_lock:
+        if _pool["executor"] is not None:
+            _pool["executor"].shutdown()
+        _pool["nøkkel"] = _pool["executor"] = None
+
+
+# %%
+def sladd_parallelt(
+    tekster: list,
+    ents_list,
+    matcher=None,
+    modell=standard_modell,
+    n_process=None,
+    chunk_size=1000,
+    batch_size=256,
+    start_method=None,
+    print_progress=False,
+    treff: list = None,
+):
+    """Sladder entiteter med NER og navnevask fordelt på flere prosesser
+
+    Hver arbeidsprosess laster spacy-modellen og navnematcheren én gang, og
+    prosessene gjenbrukes av senere kall med samme oppsett, se hent_pool.
+    Tekstene deles i biter på chunk_size og resultatet kommer tilbake i
+    samme rekkefølge som tekstene. Virker med både fork og spawn.
+
+    parameters:
+    -----------
+    tekster: list
+        Tekstene som skal vaskes
+    ents_list: list
+        Hvilke enititetstyper som skal hensyntas
+    matcher: Navnematcher
+        Navnematcher for ekstra vask av personnavn. Hoppes over dersom None
+    modell: str
+        Navnet på spacy-modellen som skal brukes
+    n_process: int
+        Antall arbeidsprosesser. Dersom dette ikke angis brukes alle kjerner
+    chunk_size: int
+        Antall tekster som sendes til en arbeidsprosess om gangen
+    batch_size: int
+        Antall tekster per batch i spacy-prosesseringen
+    start_method: str
+        "fork", "spawn" eller "forkserver". Dersom dette ikke angis brukes standard for plattformen
+    print_progress: bool
+        True om funksjonen skal printe hvor langt den har kommet underveis
+    treff: list
+        Eventuelt én Counter per tekst der treff per entitet telles, se ner_vask_tekster
+    """
+    n_process = n_process or os.cpu_count()
+    biter = [tekster[i : i + chunk_size] for i in range(0, len(tekster), chunk_size)]
+    vasket = []
+    executor = hent_pool(
+        n_process, start_method, modell, ents_list, matcher, batch_size
+    )
+    try:
+        for ind, (bit, bit_treff) in enumerate(executor.map(_vask_bit, biter), start=1):
+            if treff is not None:
+                for teller, fra_bit in zip(treff[len(vasket) :], bit_treff):
+                    teller.update(fra_bit)
+            vasket.extend(bit)
+            if print_progress == True:
+                logging.info(
+                    f"Ferdig med bit {ind} av {len(biter)} ({len(vasket)} tekster)"
+                )
+    except BaseException:
+        # en pool der en arbeidsprosess har feilet kan ikke brukes igjen
+        lukk_pool()
+        raise
+    return vasket
+
+
 # %%
 def flashtext_extract(df, text_col_input, term_liste: list, col_output=None):
     """Uttrekk av treff på navn fra SSB-navnelister vha. flashtext
@@ -292,28 +1165,20 @@ def flashtext_extract(df, text_col_input, term_liste: list, col_output=None):
 
     """
 
-    # definerer en tom keywordprocessor
-    processor = KeywordProcessor(case_sensitive=False)
-    # flashtext sin keywordprocessor splitter ord på 'spesielle tegn' - ønsker her å behandle ord med følgende tegn som enkeltord
-    processor.non_word_boundaries.add("-")
-    processor.non_word_boundaries.add("æ")
-    processor.non_word_boundaries.add("ø")
-    processor.non_word_boundaries.add("å")
-
-    processor.add_keywords_from_list(term_liste)
+    matcher = hent_navnematcher(term_liste)
 
     # gjør en replace av alle søketermene med den grupperte versjonen av termen
     if col_output:
         df[col_output] = (
             df[text_col_input]
             .astype(str)
-            .apply(lambda x: list(set(processor.extract_keywords(x))))
+            .apply(lambda x: list(set(matcher.processor.extract_keywords(x))))
         )
     else:
         df[text_col_input] = (
             df[text_col_input]
             .astype(str)
-            .apply(lambda x: list(set(processor.extract_keywords(x))))
+            .apply(lambda x: list(set(matcher.processor.extract_keywords(x))))
         )
 
     return df
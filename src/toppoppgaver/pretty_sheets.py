@@ -1,6 +1,9 @@
 # %%
+import math
 import logging
+from datetime import datetime
 
+import pandas as pd
 import xlsxwriter
 
 logging.basicConfig(level=logging.INFO)
@@ -23,9 +26,39 @@ def transform_dataframe_to_dict(data):
     return df
 
 
+# %%
+def celleverdi(value):
+    """
+    Returns a value xlsxwriter can write. Empty cells become empty strings and datetimes become strings
+    """
+    if value is None or value is pd.NaT:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    if isinstance(value, datetime):
+        return str(value)
+    return value
+
+
+# %%
+def iterate_rows(data, columns=None):
+    """
+    Returns the column names and an iterator over the rows of data
+
+    Supports a DataFrame, a dict of lists (see transform_dataframe_to_dict) or an iterator of rows together with columns
+    """
+    if isinstance(data, pd.DataFrame):
+        return list(data.columns), data.itertuples(index=False, name=None)
+    if isinstance(data, dict):
+        return list(data.keys()), zip(*data.values())
+    if columns is None:
+        raise ValueError("columns is required when data is an iterator of rows")
+    return list(columns), iter(data)
+
+
 # %%
 def make_workbook(
-    data: dict,
+    data,
     path: str,
     autofilter=False,
     last_row=0,
@@ -33,6 +66,7 @@ def make_workbook(
     hide=False,
     hide_columns=list,
     background_color="#FFFFFF",
+    columns=None,
 ):
     """
     Create workbook and sheets with custom styling
@@ -43,28 +77,32 @@ def make_workbook(
     * Freeze top row
     * Hide multiple columns
 
-    See writing dicts of data using xlsxwriter at https://xlsxwriter.readthedocs.io/working_with_data.html
+    Rows are written one at a time in xlsxwriter's constant_memory mode, so memory use does not grow with the number of rows.
+    See https://xlsxwriter.readthedocs.io/working_with_memory.html
 
     Parameters:
     ----------
-    data: dict, required
-        The dictionary to create a workbook from
+    data: DataFrame, dict or iterator of rows, required
+        The data to create a workbook from. A dict maps column names to lists of values
     path: string, required
         Set path to write the workbook
     autofilter: bool, optional
         Add autofilter to a range of columns in workbook, starting from the first column and row
-    last_row: int, required if autofilter is True
-        Specify the last row the autofilter is set to
-    last_col: int, required if autofilter is True
-        Specify the last column the autofilter is set to
+    last_row: int, optional
+        Specify the last row the autofilter is set to. Defaults to the last row written
+    last_col: int, optional
+        Specify the last column the autofilter is set to. Defaults to the last column
     hide: bool, optional
         Set True if you want to hide columns
     hide_columns: list, required if hide is True
         Pass a list of strings representing the range of columns to hide, f.ex 'A:A' hides only column A while 'A:Z' hides all columns from A to Z
     background_color: str, optional
         Set a custom color using a HEX code, else defaults to white
+    columns: list, required if data is an iterator of rows
+        The column names written to the header row
     """
-    workbook = xlsxwriter.Workbook(path)
+    columns, rows = iterate_rows(data, columns)
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
     worksheet = workbook.add_worksheet()
 
     header_format = workbook.add_format(
@@ -82,14 +120,15 @@ def make_workbook(
     cell_format.set_bg_color(background_color)
     worksheet.set_column_pixels(0, 37, 230)
     worksheet.freeze_panes(1, 0)
-    if autofilter == True:
-        worksheet.autofilter(0, 0, last_row, last_col)
 
-    col_num = 0
-    for key, value in data.items():
-        worksheet.write(0, col_num, key, header_format)
-        worksheet.write_column(1, col_num, value, cell_format)
-        col_num += 1
+    # constant_memory requires rows to be written in order, one row at a time
+    worksheet.write_row(0, 0, columns, header_format)
+    row_num = 0
+    for row_num, row in enumerate(rows, start=1):
+        worksheet.write_row(row_num, 0, [celleverdi(v) for v in row], cell_format)
+
+    if autofilter == True:
+        worksheet.autofilter(0, 0, last_row or row_num, last_col or len(columns))
     if hide == True:
         for i in hide_columns:
             worksheet.set_column(i, None, None, {"hidden": 1})
@@ -0,0 +1,208 @@
+# %%
+import json
+import time
+import logging
+import resource
+import cProfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+# %%
+rapport_mappe = Path("../../data/final/profilering/")
+
+# høyeste RSS siden sist den ble nullstilt, og filen som nullstiller den (Linux)
+status_fil = Path("/proc/self/status")
+clear_refs_fil = Path("/proc/self/clear_refs")
+
+# stegene som måles akkurat nå, i alle Stegmalere i prosessen
+_aktive_steg = []
+_aktive_lock = threading.Lock()
+
+
+# %%
+def maks_rss_mb(med_barn=True):
+    """
+    Høyeste minnebruk (RSS) for prosessen og eventuelle barneprosesser hittil, i MB
+
+    For prosessen selv gjelder det siden nullstill_rss_topp ble kalt sist.
+    """
+    # ru_maxrss er i kB på Linux
+    selv = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if not med_barn:
+        return selv / 1024
+    barn = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(selv, barn) / 1024
+
+
+def rss_topp_mb():
+    """
+    Høyeste RSS for prosessen siden nullstill_rss_topp ble kalt, i MB
+
+    Leser VmHWM fra /proc. Der den ikke finnes brukes høyeste RSS for hele
+    levetiden til prosessen.
+    """
+    try:
+        for linje in status_fil.read_text().splitlines():
+            if linje.startswith("VmHWM:"):
+                return int(linje.split()[1]) / 1024
+    except OSError:
+        pass
+    return maks_rss_mb(med_barn=False)
+
+
+def nullstill_rss_topp():
+    """
+    Sett høyeste RSS for prosessen ned til nåværende RSS. Returnerer False der det ikke går
+
+    På Linux nullstilles også ru_maxrss, som maks_rss_mb leser.
+    """
+    try:
+        clear_refs_fil.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+# %%
+class Stegmaler:
+    """Måler tid og minne for hvert navngitte steg i en kjøring
+
+    For hvert steg lagres veggtid, CPU-tid, høyeste RSS for prosessen
+    under steget og antall rader eller tekster per sekund dersom antall er
+    oppgitt. Toppen for RSS nullstilles når et steg starter, og stegene
+    som allerede måles får med seg toppen fram til da, slik at nestede og
+    samtidige steg blir riktige. Barneprosesser er ikke med i stegene.
+
+    parameters:
+    -----------
+    profiler_steg: str
+        Navnet på ett steg som skal profileres med cProfile, eller pyinstrument
+        dersom profiler er satt til "pyinstrument"
+    profiler: str
+        "cprofile" eller "pyinstrument"
+    mappe: Path
+        Mappen der rapporten og eventuelle profiler skrives
+    logg: bool
+        True om hvert steg skal logges når det er ferdig
+    """
+
+    def __init__(
+        self,
+        profiler_steg=None,
+        profiler="cprofile",
+        mappe: Path = rapport_mappe,
+        logg=True,
+    ):
+        self.profiler_steg = profiler_steg
+        self.profiler = profiler
+        self.mappe = Path(mappe)
+        self.logg = logg
+        self.start = datetime.now()
+        self.steg_liste = []
+
+    @contextmanager
+    def steg(self, navn: str, antall=None):
+        """
+        Mål et steg. Antall kan oppgis her eller settes på resultatet underveis
+
+        Eksempel:
+            with maler.steg("NER") as s:
+                ...
+                s["antall"] = len(tekster)
+        """
+        resultat = {"steg": navn, "antall": antall}
+        profil = self._start_profil() if navn == self.profiler_steg else None
+        with _aktive_lock:
+            topp = rss_topp_mb()
+            for aktivt in _aktive_steg:
+                aktivt["maks_rss_mb"] = max(aktivt["maks_rss_mb"], topp)
+            nullstill_rss_topp()
+            resultat["maks_rss_mb"] = rss_topp_mb()
+            _aktive_steg.append(resultat)
+        vegg = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield resultat
+        finally:
+            resultat["veggtid_sek"] = round(time.perf_counter() - vegg, 4)
+            resultat["cputid_sek"] = round(time.process_time() - cpu, 4)
+            with _aktive_lock:
+                _aktive_steg[:] = [s for s in _aktive_steg if s is not resultat]
+                resultat["maks_rss_mb"] = round(
+                    max(resultat["maks_rss_mb"], rss_topp_mb()), 1
+                )
+            if resultat["antall"] and resultat["veggtid_sek"] > 0:
+                resultat["per_sek"] = round(
+                    resultat["antall"] / resultat["veggtid_sek"], 1
+                )
+            if profil is not None:
+                resultat["profil"] = str(self._stopp_profil(profil, navn))
+            self.steg_liste.append(resultat)
+            if self.logg:
+                logging.info(
+                    f"Steg {navn}: {resultat['veggtid_sek']:.3f} sek, "
+                    f"{resultat['maks_rss_mb']:.0f} MB"
+                    + (
+                        f", {resultat['per_sek']} per sek"
+                        if "per_sek" in resultat
+                        else ""
+                    )
+                )
+
+    def _start_profil(self):
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+
+            profil = Profiler()
+            profil.start()
+        else:
+            profil = cProfile.Profile()
+            profil.enable()
+        return profil
+
+    def _stopp_profil(self, profil, navn: str):
+        self.mappe.mkdir(parents=True, exist_ok=True)
+        stempel = self.start.strftime("%Y%m%d-%H%M%S")
+        if self.profiler == "pyinstrument":
+            profil.stop()
+            filsti = self.mappe / f"{stempel}-{navn}.html"
+            filsti.write_text(profil.output_html(), encoding="utf-8")
+        else:
+            profil.disable()
+            filsti = self.mappe / f"{stempel}-{navn}.prof"
+            profil.dump_stats(filsti)
+        return filsti
+
+    def rapport(self):
+        """Returner rapporten for kjøringen som en dictionary
+
+        maks_rss_mb er den høyeste RSS i stegene til denne måleren, og
+        maks_rss_barn_mb den høyeste RSS i barneprosessene som er avsluttet.
+        """
+        return {
+            "start": self.start.isoformat(timespec="seconds"),
+            "veggtid_sek": round((datetime.now() - self.start).total_seconds(), 4),
+            "maks_rss_mb": max(
+                (s["maks_rss_mb"] for s in self.steg_liste),
+                default=round(rss_topp_mb(), 1),
+            ),
+            "maks_rss_barn_mb": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+            ),
+            "steg": self.steg_liste,
+        }
+
+    def skriv_rapport(self, filsti: Path = None):
+        """
+        Skriv rapporten som JSON. Dersom filsti ikke angis skrives den til mappen med tidsstempel i navnet
+        """
+        if filsti is None:
+            filsti = self.mappe / f"rapport-{self.start.strftime('%Y%m%d-%H%M%S')}.json"
+        filsti = Path(filsti)
+        filsti.parent.mkdir(parents=True, exist_ok=True)
+        filsti.write_text(
+            json.dumps(self.rapport(), ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        return filsti
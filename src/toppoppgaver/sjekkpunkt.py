@@ -0,0 +1,173 @@
+# %%
+import json
+import hashlib
+from pathlib import Path
+
+from kolonneeksport import Kolonneskriver
+
+# %%
+sjekkpunkt_mappe = Path("../../data/sjekkpunkt/")
+# stegene i main i rekkefølge. eksport har ikke eget sjekkpunkt, det er resultatet
+stegene = ["navn", "svar", "sladdet", "etterbehandlet", "eksport"]
+
+
+# %%
+def lag_nøkkel(*deler):
+    """
+    Lag en hash av inndataene til et steg, f.eks. nøkkelen til forrige steg og oppsettet
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(deler, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def fil_nøkkel(filsti: Path):
+    """
+    Lag en hash av innholdet i en fil
+    """
+    h = hashlib.sha256()
+    with open(filsti, "rb") as f:
+        for blokk in iter(lambda: f.read(1 << 20), b""):
+            h.update(blokk)
+    return h.hexdigest()[:16]
+
+
+# %%
+class Sjekkpunkter:
+    """Lagrer resultatet av hvert steg i main som Parquet, slik at en ny kjøring kan fortsette
+
+    Hvert sjekkpunkt heter <steg>-<nøkkel>.parquet, der nøkkelen er en hash
+    av inndataene til steget. manifest.json holder nøklene og eventuell
+    informasjon om stegene fra siste kjøring.
+
+    Dersom forrige kjøring ikke ble ferdig, gjenbrukes alle sjekkpunkter
+    som fortsatt passer med inndataene. Med fra_steg gjenbrukes stegene før
+    fra_steg, og fra_steg og stegene etter kjøres på nytt. Ellers starter
+    kjøringen på nytt.
+
+    parameters:
+    -----------
+    mappe: Path
+        Mappen med sjekkpunktene
+    fra_steg: str
+        Første steg som skal kjøres på nytt, se stegene
+    """
+
+    def __init__(self, mappe: Path = sjekkpunkt_mappe, fra_steg: str = None):
+        if fra_steg is not None and fra_steg not in stegene:
+            raise ValueError(f"Ukjent steg {fra_steg}, bruk et av {stegene}")
+        self.mappe = Path(mappe)
+        self.fra_steg = fra_steg
+        self.manifest_fil = self.mappe / "manifest.json"
+        self.manifest = {"ferdig": False, "steg": {}}
+        if self.manifest_fil.exists():
+            manifest = json.loads(self.manifest_fil.read_text(encoding="utf-8"))
+            if fra_steg is not None or not manifest.get("ferdig"):
+                self.manifest = manifest
+        self.manifest["ferdig"] = False
+        # sjekkpunkter som ikke ble skrevet ferdig i en tidligere kjøring
+        for tmp in self.mappe.glob("*.tmp"):
+            tmp.unlink()
+
+    def filsti(self, steg: str, nøkkel: str):
+        return self.mappe / f"{steg}-{nøkkel}.parquet"
+
+    def nøkkel(self, steg: str):
+        """
+        Nøkkelen til sjekkpunktet for steget fra forrige kjøring, eller None
+        """
+        return self.manifest["steg"].get(steg, {}).get("nøkkel")
+
+    def info(self, steg: str):
+        """
+        Informasjonen som ble lagret sammen med sjekkpunktet for steget
+        """
+        return self.manifest["steg"].get(steg, {}).get("info", {})
+
+    def kan_gjenbrukes(self, steg: str, nøkkel: str = None):
+        """Avgjør om sjekkpunktet for steget skal brukes i stedet for å kjøre steget
+
+        Steg som leser fra nett eller disk (navn og svar) har ingen nøkkel før
+        de er kjørt, og gjenbrukes dersom sjekkpunktet finnes. Andre steg
+        gjenbrukes bare dersom nøkkelen er den samme. Kaster ValueError dersom
+        et steg før fra_steg ikke kan gjenbrukes.
+        """
+        lagret = self.nøkkel(steg)
+        gyldig = (
+            lagret is not None
+            and (nøkkel is None or nøkkel == lagret)
+            and self.filsti(steg, lagret).exists()
+        )
+        if self.fra_steg is None:
+            return gyldig
+        if stegene.index(steg) >= stegene.index(self.fra_steg):
+            return False
+        if not gyldig:
+            raise ValueError(
+                f"Sjekkpunktet for {steg} mangler eller passer ikke med oppsettet, "
+                f"kjør fra steget {steg} eller tidligere"
+            )
+        return True
+
+    def les(self, steg: str, bitstørrelse=None):
+        """
+        Les sjekkpunktet for steget, i biter med så mange rader dersom bitstørrelse er satt
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        fil = pq.ParquetFile(self.filsti(steg, self.nøkkel(steg)))
+        if not bitstørrelse:
+            yield fil.read().to_pandas()
+            return
+        for batch in fil.iter_batches(batch_size=bitstørrelse):
+            yield pa.Table.from_batches([batch]).to_pandas()
+
+    def lagre(self, steg: str, nøkkel: str, biter, etiketter: dict = None, info=None):
+        """Skriv alle bitene til sjekkpunktet for steget
+
+        Sjekkpunktet regnes som gyldig først når alle bitene er skrevet, og
+        erstatter da eldre sjekkpunkter for steget. Neste steg leser bitene
+        tilbake med les. Sjekkpunktene for stegene
+        etter blir ugyldige fordi nøklene deres bygger på nøkkelen til steget.
+
+        parameters:
+        -----------
+        biter: iterator
+            Dataframes med resultatet av steget
+        etiketter: dict
+            Spørsmålsteksten per kolonne, se Kolonneskriver
+        info: dict
+            Informasjon som lagres i manifestet, kan fylles ut mens bitene lages
+        """
+        filsti = self.filsti(steg, nøkkel)
+        tmp = filsti.with_suffix(".tmp")
+        with Kolonneskriver(tmp, "parquet", etiketter) as skriver:
+            for bit in biter:
+                skriver.skriv(bit)
+        if not tmp.exists():
+            # ingen biter, skriver en tom fil slik at steget kan gjenbrukes
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.table({}), tmp)
+        for gammel in self.mappe.glob(f"{steg}-*.parquet"):
+            gammel.unlink()
+        tmp.replace(filsti)
+        self.manifest["steg"][steg] = {"nøkkel": nøkkel, "info": info or {}}
+        self._skriv_manifest()
+
+    def ferdig(self):
+        """
+        Marker kjøringen som ferdig, slik at neste kjøring starter på nytt
+        """
+        self.manifest["ferdig"] = True
+        self._skriv_manifest()
+
+    def _skriv_manifest(self):
+        self.mappe.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_fil.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(self.manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        tmp.replace(self.manifest_fil)
@@ -0,0 +1,110 @@
+# %%
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+# %%
+class Sladdecache:
+    """Cache fra uvasket tekst til vasket tekst og treff per entitet
+
+    Nøkkelen er teksten sammen med et fingeravtrykk av modellen, mønstrene og
+    navnelisten, slik at like svar bare vaskes én gang. Holder de sist brukte
+    tekstene i minnet og kan i tillegg lagre dem i en SQLite-fil mellom kjøringer.
+    Kan deles mellom tråder.
+
+    parameters:
+    -----------
+    fingeravtrykk: str
+        Hash av alt som påvirker vaskingen, se ner_vask_opplysninger.vask_fingeravtrykk
+    maks_antall: int
+        Maks antall tekster som holdes i minnet
+    filsti: Path
+        Eventuell SQLite-fil for varig lagring. Brukes ikke dersom dette ikke angis
+    """
+
+    def __init__(self, fingeravtrykk: str, maks_antall=100_000, filsti: Path = None):
+        self.fingeravtrykk = fingeravtrykk
+        self.maks_antall = maks_antall
+        self.minne = OrderedDict()
+        self.lås = threading.RLock()
+        self.con = None
+        if filsti:
+            filsti = Path(filsti)
+            filsti.parent.mkdir(parents=True, exist_ok=True)
+            self.con = sqlite3.connect(filsti, check_same_thread=False)
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS cache (nokkel TEXT PRIMARY KEY, vasket TEXT, treff TEXT)"
+            )
+            kolonner = [r[1] for r in self.con.execute("PRAGMA table_info(cache)")]
+            if "treff" not in kolonner:
+                # cache fra før treffene ble lagret, radene uten treff vaskes på nytt
+                self.con.execute("ALTER TABLE cache ADD COLUMN treff TEXT")
+
+    def _nøkkel(self, tekst: str):
+        return hashlib.sha1(
+            f"{self.fingeravtrykk}\0{tekst}".encode("utf-8")
+        ).hexdigest()
+
+    def _husk(self, tekst: str, vasket: tuple):
+        self.minne[tekst] = vasket
+        self.minne.move_to_end(tekst)
+        if len(self.minne) > self.maks_antall:
+            self.minne.popitem(last=False)
+
+    def hent_mange(self, tekster: list):
+        """
+        Returner {tekst: (vasket, treff)} for tekstene som finnes i cachen
+        """
+        with self.lås:
+            return self._hent_mange(tekster)
+
+    def _hent_mange(self, tekster: list):
+        funnet = {}
+        mangler = []
+        for tekst in tekster:
+            if tekst in self.minne:
+                self.minne.move_to_end(tekst)
+                funnet[tekst] = self.minne[tekst]
+            else:
+                mangler.append(tekst)
+        if self.con is not None and mangler:
+            nøkler = {self._nøkkel(t): t for t in mangler}
+            liste = list(nøkler)
+            for i in range(0, len(liste), 500):
+                bit = liste[i : i + 500]
+                rader = self.con.execute(
+                    f"SELECT nokkel, vasket, treff FROM cache WHERE treff IS NOT NULL AND nokkel IN ({','.join('?' * len(bit))})",
+                    bit,
+                )
+                for nøkkel, vasket, treff in rader:
+                    funnet[nøkler[nøkkel]] = (vasket, json.loads(treff))
+                    self._husk(nøkler[nøkkel], funnet[nøkler[nøkkel]])
+        return funnet
+
+    def lagre_mange(self, vaskede: dict):
+        """
+        Legg {tekst: (vasket, treff)} inn i cachen, der treff er {entitet: antall}
+        """
+        with self.lås:
+            self._lagre_mange(vaskede)
+
+    def _lagre_mange(self, vaskede: dict):
+        for tekst, vasket in vaskede.items():
+            self._husk(tekst, vasket)
+        if self.con is not None and vaskede:
+            with self.con:
+                self.con.executemany(
+                    "INSERT OR REPLACE INTO cache (nokkel, vasket, treff) VALUES (?, ?, ?)",
+                    [
+                        (self._nøkkel(t), v, json.dumps(treff))
+                        for t, (v, treff) in vaskede.items()
+                    ],
+                )
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
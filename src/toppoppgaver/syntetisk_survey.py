@@ -0,0 +1,202 @@
+# %%
+import uuid
+import random
+from pathlib import Path
+
+import pandas as pd
+
+# %%
+fornavn = [
+    "Ola",
+    "Kari",
+    "Per",
+    "Anne",
+    "Lars",
+    "Ingrid",
+    "Ole",
+    "Marit",
+    "Jon",
+    "Anne-Lise",
+    "Håkon",
+    "Solveig",
+    "Bjørn",
+    "Åse",
+]
+etternavn = [
+    "Hansen",
+    "Johansen",
+    "Olsen",
+    "Larsen",
+    "Andersen",
+    "Pedersen",
+    "Nilsen",
+    "Kristiansen",
+    "Jensen",
+    "Berg",
+    "Haugen",
+    "Bakke",
+    "Sæther",
+    "Ødegård",
+]
+
+setninger = [
+    "jeg fant ikke det jeg lette etter",
+    "Søknaden om dagpenger var vanskelig å fylle ut",
+    "vet ikke",
+    "nei",
+    "ingen",
+    "Det var vanskelig å finne riktig skjema for sykepenger.",
+    "Jeg prøvde å logge inn for å se utbetalingen min, men fikk feilmelding",
+    "Hvorfor tar det så lang tid å få svar på søknaden om arbeidsavklaringspenger?",
+    "ok",
+    "Fant svaret etter en stund, men siden var rotete og lite oversiktlig.",
+    "jeg vil sende en melding til veilederen min",
+    "Takk for god hjelp!",
+]
+
+kategorier = ["Ja", "Nei", "Delvis", "Vet ikke"]
+
+# maler for personopplysninger som settes inn i fritekst, med entiteten de skal gi
+pii_maler = [
+    ("PER", "Jeg snakket med {navn} på telefon"),
+    ("PER", "{navn} hos NAV hjalp meg"),
+    ("FNR", "fødselsnummeret mitt er {fnr}"),
+    ("TLF", "ring meg på {tlf}"),
+    ("EPOST", "send svar til {epost}"),
+]
+
+
+# %%
+def _fnr(rng: random.Random):
+    return f"{rng.randint(1, 28):02d}{rng.randint(1, 12):02d}{rng.randint(40, 99):02d}{rng.randint(10000, 99999)}"
+
+
+def _tlf(rng: random.Random):
+    tlf = f"{rng.choice('49')}{rng.randint(1000000, 9999999)}"
+    return rng.choice([tlf, f"+47 {tlf}", f"{tlf[:3]} {tlf[3:5]} {tlf[5:]}"])
+
+
+def _navn(rng: random.Random, navneliste: list):
+    return f"{rng.choice(navneliste)} {rng.choice(etternavn)}"
+
+
+def _epost(rng: random.Random):
+    lokal = f"{rng.choice(fornavn)}.{rng.choice(etternavn)}".lower().replace("-", "")
+    return f"{lokal}@example.no"
+
+
+# %%
+def lag_fritekst(rng: random.Random, andel_pii: float, navneliste: list = fornavn):
+    """
+    Lag et fritekstsvar, eventuelt med en innsatt personopplysning
+
+    Returnerer teksten og en liste med (entitet, verdi) som er satt inn
+    """
+    tekst = rng.choice(setninger)
+    fasit = []
+    if rng.random() < andel_pii:
+        entitet, mal = rng.choice(pii_maler)
+        verdier = {
+            "PER": _navn(rng, navneliste),
+            "FNR": _fnr(rng),
+            "TLF": _tlf(rng),
+            "EPOST": _epost(rng),
+        }
+        verdi = verdier[entitet]
+        innsatt = mal.format(
+            navn=verdier["PER"],
+            fnr=verdier["FNR"],
+            tlf=verdier["TLF"],
+            epost=verdier["EPOST"],
+        )
+        tekst = f"{tekst}. {innsatt}" if rng.random() < 0.5 else f"{innsatt}. {tekst}"
+        fasit.append((entitet, verdi))
+    return tekst, fasit
+
+
+# %%
+def lag_survey(
+    antall_rader=1000,
+    antall_fritekst=30,
+    antall_kategorier=20,
+    andel_besvart=0.1,
+    andel_pii=0.1,
+    seed=0,
+    navneliste: list = fornavn,
+):
+    """Lag en syntetisk Task Analytics-eksport med samme form som de ekte svarene
+
+    Første rad inneholder spørsmålsteksten, som i eksportene fra Task Analytics.
+    Fritekstkolonnene heter answers.comment*, answers.freetext* og answers.*_o.
+
+    parameters:
+    -----------
+    antall_rader: int
+        Antall svar
+    antall_fritekst: int
+        Antall fritekstkolonner
+    antall_kategorier: int
+        Antall kolonner med kategorisvar
+    andel_besvart: float
+        Sannsynligheten for at en fritekstcelle er besvart
+    andel_pii: float
+        Sannsynligheten for at et fritekstsvar inneholder en personopplysning
+    seed: int
+        Seed for tilfeldige tall, samme seed gir samme datasett
+    navneliste: list
+        Fornavn som settes inn i svarene
+
+    Returns
+    -------
+    df: pd.DataFrame med spørsmålsraden først
+    fasit: pd.DataFrame med radnummer, kolonne, entitet og verdi for hver innsatte personopplysning
+    """
+    rng = random.Random(seed)
+    fritekst_kolonner = []
+    for i in range(antall_fritekst):
+        fritekst_kolonner.append(
+            [f"answers.comment{i}", f"answers.freetext{i}", f"answers.q{i}_o"][i % 3]
+        )
+    kategori_kolonner = [f"answers.q{i}" for i in range(antall_kategorier)]
+    meta_kolonner = ["id", "start", "complete", "done", "startUrl", "doneUrl"]
+
+    sporsmal = {k: k for k in meta_kolonner}
+    sporsmal.update({k: f"Spørsmål {k}" for k in kategori_kolonner})
+    sporsmal.update({k: f"Fortell oss mer ({k})" for k in fritekst_kolonner})
+
+    start = pd.Timestamp("2024-01-01")
+    rader = []
+    fasit = []
+    for rad in range(antall_rader):
+        tid = start + pd.Timedelta(seconds=rng.randint(0, 365 * 24 * 60 * 60))
+        verdier = {
+            "id": str(rad + 1),
+            "start": tid.isoformat(),
+            "complete": (tid + pd.Timedelta(minutes=3)).isoformat(),
+            "done": (tid + pd.Timedelta(minutes=4)).isoformat(),
+            "startUrl": f"https://www.nav.no/soknad/{uuid.UUID(int=rng.getrandbits(128))}?id={rng.randint(10**6, 10**9)}",
+            "doneUrl": "https://www.nav.no/",
+        }
+        for k in kategori_kolonner:
+            verdier[k] = rng.choice(kategorier)
+        for k in fritekst_kolonner:
+            if rng.random() < andel_besvart:
+                tekst, treff = lag_fritekst(rng, andel_pii, navneliste)
+                verdier[k] = tekst
+                fasit.extend((rad, k, entitet, verdi) for entitet, verdi in treff)
+        rader.append(verdier)
+
+    kolonner = meta_kolonner + kategori_kolonner + fritekst_kolonner
+    df = pd.DataFrame([sporsmal] + rader, columns=kolonner)
+    return df, pd.DataFrame(fasit, columns=["rad", "kolonne", "entitet", "verdi"])
+
+
+# %%
+def skriv_survey(df: pd.DataFrame, filsti: Path):
+    """
+    Skriv den syntetiske eksporten som CSV, på samme format som download_survey
+    """
+    filsti = Path(filsti)
+    filsti.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(filsti, index=False)
+    return filsti
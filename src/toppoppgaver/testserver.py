@@ -0,0 +1,269 @@
+# %%
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import requests
+
+from navn import navn_fra_jsonstat
+from nedlasting import lag_sesjon, last_ned, last_ned_json, last_ned_survey
+from syntetisk_survey import lag_survey, fornavn, etternavn
+
+# %%
+# tabellene i SSBs API som navn.py bruker, med dimensjonen og navnene som svares
+ssb_tabeller = {"10501": ("Fornavn", fornavn), "12891": ("Etternavn", etternavn)}
+test_token = "testtoken"
+
+
+# %%
+def jsonstat(dimensjon: str, navn: list):
+    """
+    Lag en json-stat2-respons med navnene som kategorier, slik SSB svarer
+    """
+    return {
+        "version": "2.0",
+        "class": "dataset",
+        "id": [dimensjon],
+        "size": [len(navn)],
+        "dimension": {
+            dimensjon: {
+                "category": {
+                    "index": {str(i): i for i in range(len(navn))},
+                    "label": {str(i): n for i, n in enumerate(navn)},
+                }
+            }
+        },
+        "value": [1] * len(navn),
+    }
+
+
+# %%
+class Testhandler(BaseHTTPRequestHandler):
+    """Lokal erstatning for SSBs tabell-API og Task Analytics
+
+    POST /ssb/<tabell> svarer med json-stat2 for tabellene i ssb_tabeller.
+    POST /ta/auth/login gir et token, og POST /ta/export/tm_<id> strømmer en
+    syntetisk eksport som CSV med chunked overføring.
+
+    De første feil_først forespørslene får 503, og hver forespørsel venter
+    forsinkelse sekunder før svaret sendes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    feil_først = 0
+    forsinkelse = 0.0
+    rader = 500
+    bitstørrelse = 64 * 1024
+    # antall forespørsler og antall som har fått 503, deles av alle trådene
+    teller = None
+
+    def _svar(self, status: int, body: bytes, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _strøm(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(body), self.bitstørrelse):
+            bit = body[i : i + self.bitstørrelse]
+            self.wfile.write(f"{len(bit):X}\r\n".encode("ascii") + bit + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.teller["lock"]:
+            self.teller["forespørsler"] += 1
+            feiler = self.teller["feilet"] < self.feil_først
+            if feiler:
+                self.teller["feilet"] += 1
+        time.sleep(self.forsinkelse)
+        if feiler:
+            self._svar(503, b'{"feil": "midlertidig utilgjengelig"}')
+            return
+
+        if self.path.startswith("/ssb/"):
+            tabell = self.path.rsplit("/", 1)[-1]
+            if tabell not in ssb_tabeller:
+                self._svar(404, b'{"feil": "ukjent tabell"}')
+                return
+            self._svar(200, json.dumps(jsonstat(*ssb_tabeller[tabell])).encode())
+        elif self.path == "/ta/auth/login":
+            # alle brukernavn og passord godtas, også tomme
+            self._svar(200, json.dumps({"access_token": test_token}).encode())
+        elif self.path.startswith("/ta/export/tm_"):
+            if self.headers.get("Authorization") != f"JWT {test_token}":
+                self._svar(401, b'{"feil": "ugyldig token"}')
+                return
+            self._strøm(lag_csv(self.rader), "text/csv")
+        else:
+            self._svar(404, b'{"feil": "ukjent sti"}')
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+class Testserver(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # klienten har gitt opp, f.eks. etter timeout i sjekk_nedlasting
+        logging.debug(f"Forespørselen fra {client_address} ble avbrutt")
+
+
+# %%
+def lag_csv(rader: int):
+    """
+    Den syntetiske eksporten testserveren svarer med, som CSV
+    """
+    df, _ = lag_survey(rader, andel_besvart=0.2, andel_pii=0.3)
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def lag_testserver(host="127.0.0.1", port=0, feil_først=0, forsinkelse=0.0, rader=500):
+    """Lag en testserver. Med port 0 velges en ledig port
+
+    parameters:
+    -----------
+    feil_først: int
+        Antall forespørsler som først svarer med 503
+    forsinkelse: float
+        Sekunder hver forespørsel venter før svaret sendes
+    rader: int
+        Antall svar i den syntetiske eksporten
+    """
+    handler = type(
+        "Handler",
+        (Testhandler,),
+        {
+            "feil_først": feil_først,
+            "forsinkelse": forsinkelse,
+            "rader": rader,
+            "teller": {"forespørsler": 0, "feilet": 0, "lock": threading.Lock()},
+        },
+    )
+    return Testserver((host, port), handler)
+
+
+def start_i_bakgrunnen(server: Testserver):
+    """
+    Kjør serveren i en egen tråd og returner adressene til SSB og Task Analytics
+    """
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/ssb", f"http://{host}:{port}/ta"
+
+
+# %%
+def sjekk_nedlasting(mappe: Path = None):
+    """Sjekk nedlasting.py mot testserveren uten nett
+
+    * nye forsøk: de to første forespørslene får 503, og navnene kommer likevel
+    * timeout: en for treg server gir timeout på lesingen også etter nytt
+      forsøk, og ingen fil skrives
+    * strømming: eksporten kommer i biter med chunked overføring og blir lik originalen
+
+    Kaster AssertionError dersom en av sjekkene feiler.
+    """
+    mappe = Path(mappe or tempfile.mkdtemp())
+
+    server = lag_testserver(feil_først=2)
+    ssb, _ = start_i_bakgrunnen(server)
+    try:
+        data = last_ned_json(
+            lag_sesjon(forsøk=3, backoff=0), f"{ssb}/10501", mappe / "fornavn.json", {}
+        )
+        assert navn_fra_jsonstat(data, "Fornavn") == fornavn
+        teller = server.RequestHandlerClass.teller
+        assert teller["forespørsler"] == 3, teller
+        logging.info("Nye forsøk: OK etter 2 svar med 503")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    server = lag_testserver(forsinkelse=2.0)
+    ssb, _ = start_i_bakgrunnen(server)
+    filsti = mappe / "etternavn.json"
+    try:
+        start = time.perf_counter()
+        try:
+            last_ned(
+                lag_sesjon(forsøk=1, backoff=0),
+                "POST",
+                f"{ssb}/12891",
+                filsti,
+                timeout=(1, 0.2),
+            )
+        except (requests.Timeout, requests.ConnectionError) as e:
+            # med nye forsøk kommer timeout på lesingen som ConnectionError
+            # fra urllib3, med ReadTimeoutError som årsak
+            assert "Read timed out" in str(e), e
+        else:
+            raise AssertionError("Forventet timeout fra en treg server")
+        brukt = time.perf_counter() - start
+        assert brukt < 2.0, brukt
+        assert server.RequestHandlerClass.teller["forespørsler"] == 2
+        assert not filsti.exists()
+        logging.info(f"Timeout: OK etter 2 forsøk og {brukt:.2f} sek")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    server = lag_testserver(rader=5000)
+    _, ta = start_i_bakgrunnen(server)
+    filsti = mappe / "survey.csv"
+    try:
+        last_ned_survey(lag_sesjon(), "test", "test", "03381", filsti, url=ta)
+        assert filsti.read_bytes() == lag_csv(5000)
+        assert not filsti.with_suffix(".csv.tmp").exists()
+        # første rad er spørsmålsteksten
+        assert len(pd.read_csv(filsti)) == 5000 + 1
+        logging.info(f"Strømming: OK, {filsti.stat().st_size} byte")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Lokal erstatning for SSB og Task Analytics for kjøring uten nett"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--feil-forst", type=int, default=0)
+    parser.add_argument("--forsinkelse", type=float, default=0.0)
+    parser.add_argument("--rader", type=int, default=500)
+    parser.add_argument(
+        "--sjekk",
+        action="store_true",
+        help="sjekk nye forsøk, timeout og strømming i nedlastingen og avslutt",
+    )
+    args = parser.parse_args()
+
+    if args.sjekk:
+        sjekk_nedlasting()
+    else:
+        server = lag_testserver(
+            args.host, args.port, args.feil_forst, args.forsinkelse, args.rader
+        )
+        url = f"http://{args.host}:{server.server_address[1]}"
+        logging.info(f"Lytter på {url}, bruk ssb_url={url}/ssb og ta_url={url}/ta")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
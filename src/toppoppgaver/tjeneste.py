@@ -0,0 +1,297 @@
+# %%
+import os
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ner_vask_opplysninger as ner
+from navn import hent_navneliste, navneliste_fil
+from navnematcher import hent_navnematcher
+from sladdecache import Sladdecache
+
+# %%
+standard_ents = ["PER", "FNR", "TLF", "EPOST", "TALL", "ÅR", "finne", "andre"]
+
+
+# %%
+class _Jobb:
+    def __init__(self, tekster: list, ents_list: tuple):
+        self.tekster = tekster
+        self.ents_list = ents_list
+        self.future = Future()
+
+
+# %%
+class Sladdetjeneste:
+    """Holder modellen og navnematcheren varme og vasker tekster i små batcher
+
+    Forespørsler som kommer inn nesten samtidig slås sammen til én batch per
+    entitetsliste før de sendes til sladd_liste. Batchene kjøres i en
+    begrenset trådpool, og køen foran er begrenset slik at en overbelastet
+    tjeneste svarer med feil i stedet for å vokse i minne. Arbeiderne deler
+    modellen og bruker den etter tur, men regex og cache kjøres samtidig.
+
+    parameters:
+    -----------
+    term_liste: list
+        Navnene som vaskes i navnevasken
+    modell: str
+        Navnet på spacy-modellen eller modellnivået sm, md, lg eller regex
+    arbeidere: int
+        Antall batcher som vaskes samtidig
+    maks_batch: int
+        Maks antall tekster som slås sammen i én batch
+    maks_ventetid: float
+        Hvor mange sekunder en forespørsel kan vente på flere før batchen sendes
+    maks_kø: int
+        Maks antall forespørsler som venter
+    maks_cacher: int
+        Maks antall entitetslister det holdes en cache for. Cachen for den
+        listen som er brukt minst nylig fjernes først
+    """
+
+    def __init__(
+        self,
+        term_liste: list,
+        modell=ner.standard_modell,
+        arbeidere=2,
+        maks_batch=256,
+        maks_ventetid=0.01,
+        maks_kø=1000,
+        maks_cacher=8,
+    ):
+        self.term_liste = term_liste
+        self.modell = modell
+        self.maks_batch = maks_batch
+        self.maks_ventetid = maks_ventetid
+        self.kø = queue.Queue(maxsize=maks_kø)
+        self.ledige = threading.Semaphore(arbeidere)
+        self.pool = ThreadPoolExecutor(max_workers=arbeidere)
+        self.maks_cacher = maks_cacher
+        self.cacher = OrderedDict()
+
+        # varm opp modellen, entity ruler og navnetrien før første forespørsel
+        logging.info("Laster modell og navneliste")
+        if ner.modell_for(modell) is not None:
+            ner.hent_nlp(modell)
+        self.matcher = hent_navnematcher(term_liste)
+        self.samler = threading.Thread(target=self._samle, daemon=True)
+        self.samler.start()
+
+    def sladd(self, tekster: list, ents_list=standard_ents, timeout=None):
+        """
+        Legg tekstene i køen og vent på de vaskede tekstene og treffene per tekst
+
+        Kaster queue.Full dersom køen er full
+        """
+        # samme entiteter i en annen rekkefølge vaskes likt og deler cache
+        jobb = _Jobb(list(tekster), tuple(sorted(set(ents_list))))
+        self.kø.put_nowait(jobb)
+        return jobb.future.result(timeout=timeout)
+
+    def _cache(self, ents_list: tuple):
+        # kalles bare fra samletråden
+        if ents_list not in self.cacher:
+            self.cacher[ents_list] = Sladdecache(
+                ner.vask_fingeravtrykk(
+                    list(ents_list), self.modell, self.matcher, ner.forfilter_regler
+                )
+            )
+            if len(self.cacher) > self.maks_cacher:
+                self.cacher.popitem(last=False)
+        self.cacher.move_to_end(ents_list)
+        return self.cacher[ents_list]
+
+    def _samle(self):
+        while True:
+            jobb = self.kø.get()
+            if jobb is None:
+                return
+            batch = [jobb]
+            antall = len(jobb.tekster)
+            frist = time.monotonic() + self.maks_ventetid
+            while antall < self.maks_batch:
+                rest = frist - time.monotonic()
+                if rest <= 0:
+                    break
+                try:
+                    neste = self.kø.get(timeout=rest)
+                except queue.Empty:
+                    break
+                if neste is None:
+                    self.kø.put(None)
+                    break
+                batch.append(neste)
+                antall += len(neste.tekster)
+
+            grupper = {}
+            for jobb in batch:
+                grupper.setdefault(jobb.ents_list, []).append(jobb)
+            for ents_list, jobber in grupper.items():
+                # venter på en ledig arbeider, slik at køen fylles opp ved overlast
+                self.ledige.acquire()
+                self.pool.submit(self._kjør, ents_list, jobber, self._cache(ents_list))
+
+    def _kjør(self, ents_list: tuple, jobber: list, cache: Sladdecache):
+        try:
+            treff = []
+            vasket = ner.sladd_liste(
+                [t for jobb in jobber for t in jobb.tekster],
+                term_liste=self.term_liste,
+                ents_list=list(ents_list),
+                print_progress=False,
+                modell=self.modell,
+                cache=cache,
+                treff=treff,
+                matcher=self.matcher,
+            )
+            neste = 0
+            for jobb in jobber:
+                slutt = neste + len(jobb.tekster)
+                jobb.future.set_result((vasket[neste:slutt], treff[neste:slutt]))
+                neste = slutt
+        except Exception as e:
+            for jobb in jobber:
+                if not jobb.future.done():
+                    jobb.future.set_exception(e)
+        finally:
+            self.ledige.release()
+
+    def close(self):
+        self.kø.put(None)
+        self.samler.join()
+        self.pool.shutdown()
+
+
+# %%
+class Sladdehandler(BaseHTTPRequestHandler):
+    """
+    POST /sladd med {"tekster": [...], "ents": [...]} og GET /helse
+    """
+
+    tjeneste: Sladdetjeneste = None
+    timeout_sek = 300
+
+    def _svar(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/helse":
+            self._svar(200, {"status": "ok", "modell": self.tjeneste.modell})
+        else:
+            self._svar(404, {"feil": f"ukjent sti {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/sladd":
+            self._svar(404, {"feil": f"ukjent sti {self.path}"})
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            tekster = data["tekster"]
+            ents_list = data.get("ents", standard_ents)
+            if not isinstance(tekster, list) or not all(
+                isinstance(t, str) for t in tekster
+            ):
+                raise ValueError("tekster må være en liste med tekst")
+            if not isinstance(ents_list, list) or not all(
+                isinstance(e, str) for e in ents_list
+            ):
+                raise ValueError("ents må være en liste med entitetstyper")
+        except (TypeError, KeyError, ValueError) as e:
+            self._svar(400, {"feil": str(e)})
+            return
+        try:
+            vasket, treff = self.tjeneste.sladd(
+                tekster, ents_list, timeout=self.timeout_sek
+            )
+        except queue.Full:
+            self._svar(503, {"feil": "tjenesten er opptatt, prøv igjen senere"})
+            return
+        except Exception as e:
+            logging.exception("Vaskingen feilet")
+            self._svar(500, {"feil": str(e)})
+            return
+        self._svar(200, {"tekster": vasket, "treff": treff})
+
+    def address_string(self):
+        # Unix-socket har ingen klientadresse
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+class TCPServer(ThreadingHTTPServer):
+    # mange samtidige klienter skal vente i køen, ikke få tilkoblingen avvist
+    request_queue_size = 128
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# %%
+def lag_server(tjeneste: Sladdetjeneste, host="127.0.0.1", port=8080, socket=None):
+    """
+    Lag en HTTP-server rundt tjenesten, på en Unix-socket dersom socket er angitt
+    """
+    handler = type("Handler", (Sladdehandler,), {"tjeneste": tjeneste})
+    if socket:
+        if os.path.exists(socket):
+            os.remove(socket)
+        return UnixHTTPServer(socket, handler)
+    return TCPServer((host, port), handler)
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Lokal tjeneste som vasker fritekst med varm modell og navneliste"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--socket", help="sti til en Unix-socket i stedet for TCP")
+    parser.add_argument(
+        "--modell",
+        default=ner.standard_modell,
+        help="spacy-modell eller modellnivå: sm, md, lg eller regex",
+    )
+    parser.add_argument("--arbeidere", type=int, default=2)
+    parser.add_argument("--maks-batch", type=int, default=256)
+    parser.add_argument("--maks-ventetid", type=float, default=0.01)
+    parser.add_argument("--maks-ko", type=int, default=1000)
+    parser.add_argument("--maks-cacher", type=int, default=8)
+    args = parser.parse_args()
+
+    tjeneste = Sladdetjeneste(
+        hent_navneliste(navneliste_fil),
+        modell=args.modell,
+        arbeidere=args.arbeidere,
+        maks_batch=args.maks_batch,
+        maks_ventetid=args.maks_ventetid,
+        maks_kø=args.maks_ko,
+        maks_cacher=args.maks_cacher,
+    )
+    server = lag_server(tjeneste, args.host, args.port, args.socket)
+    logging.info(f"Lytter på {args.socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        tjeneste.close()